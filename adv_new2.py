@@ -1,48 +1,21 @@
-import requests
-import json
+import argparse
+import asyncio
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import timedelta
 from dotenv import load_dotenv
-import os
-import time
 from datetime import date
-from clickhouse_connect import get_client
+from cabinets import cabinet_keys, max_concurrency
+from clickhouse_sink import get_clickhouse_client
+from schemas import CAMPAIGN_DATA_WB
+from wb_adverts import active_campaign_ids, sync_campaign_catalog
+from wb_client import WBClient, run_projects
+from wb_fullstats import aggregate_fullstats, flatten_fullstats
 
 # Load environment variables
 load_dotenv()
 
-# Retrieve API keys from environment variables
-KeyGuten = os.getenv('KeyGuten')
-KeyGiper = os.getenv('KeyGiper')
-KeyKitchen = os.getenv('KeyKitchen')
-KeySmart = os.getenv('KeySmart')
-password = os.getenv('ClickHouse')
-
-# Define headers for each project
-headers_guten = {
-    'Authorization': KeyGuten,
-    'Accept': 'application/json',
-    'Content-Type': 'application/json'  # Ensure this header is set
-}
-
-headers_giper = {
-    'Authorization': KeyGiper,
-    'Accept': 'application/json',
-    'Content-Type': 'application/json'  # Ensure this header is set
-}
-
-headers_kitchen = {
-    'Authorization': KeyKitchen,
-    'Accept': 'application/json',
-    'Content-Type': 'application/json'  # Ensure this header is set
-}
-
-headers_smart = {
-    'Authorization': KeySmart,
-    'Accept': 'application/json',
-    'Content-Type': 'application/json'  # Ensure this header is set
-
-}
+# API keys for each project from the cabinet registry
+project_keys = cabinet_keys()
 
 # Fetch campaign statistics for each project
 
@@ -51,177 +24,29 @@ period = {"begin": yesterday, "end":yesterday}
 yesterday_start = f"{yesterday} 00:00:00"
 yesterday_end = f"{yesterday} 23:59:59"
 
-# Function to fetch campaign data
-def fetch_campaign_data(url, headers, project_name):
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        data = response.json()
-        df = pd.json_normalize(data['adverts'], record_path='advert_list', meta=['type', 'status', 'count'])
-        df['changeTime'] = pd.to_datetime(df['changeTime'])
-        df = df.reset_index(drop=True)
-        return df
-    else:
-        print(f"Failed to retrieve data for {project_name}. Status code: {response.status_code}")
-        return pd.DataFrame()
-
-# Function to fetch campaign details
-def fetch_campaign_details(url, headers, project_name, campaign_ids, chunk_size=50):
-    all_campaign_data = []
-    campaign_chunks = [campaign_ids[i:i + chunk_size] for i in range(0, len(campaign_ids), chunk_size)]
-    query_params = {
-        "order": "create",  # Order by the "change" field
-        "direction": "desc"
-    }
-    for idx, chunk in enumerate(campaign_chunks):
-        response = requests.post(url, params=query_params, headers=headers, json=chunk)
-        if response.status_code == 200:
-            data = response.json()
-            all_campaign_data.extend(data)
-            print(f"Data retrieved successfully for {project_name} chunk {idx + 1}")
-        else:
-            print(f"Error for {project_name} chunk {idx + 1}: {response.status_code}, {response.text}")
-        time.sleep(1)  # Add a delay to avoid hitting API rate limits
-
-    return pd.DataFrame(all_campaign_data)
-
-# Function to fetch campaign statistics using get_report
-def get_report(url, headers, begin, end, page, project_name):
-    all_data = []
-    max_retries = 3
-    retry_delay = 30  # seconds
-    request_timeout = 60  # seconds
-
-    while True:
-        for attempt in range(max_retries):
-            try:
-                # Define the request body with all required parameters
-                request_body = {
-                    "period": {
-                        "begin": begin,
-                        "end": end
-                    },
-                    "orderBy": {
-                        "field": "ordersSumRub",
-                        "mode": "desc"
-                    },
-                    "page": page,
-                    "timezone": "Europe/Moscow",
-                    "brandNames": [],
-                    "objectIDs": [],
-                    "nmIDs": []
-                }
+# Function to fetch campaigns, campaign statistics and product history for one project
+async def fetch_project_data(project_name, api_key):
+    async with WBClient(api_key, project_name) as client:
+        df_advert = await client.fetch_campaign_count()
+        campaigns = await sync_campaign_catalog(client, df_advert)
+
+        # Fetch and flatten the campaign statistics for yesterday
+        advert_ids = active_campaign_ids(campaigns, [yesterday], adverts=df_advert)
+        campaign_stats = await client.fetch_campaign_stats(advert_ids, [yesterday])
+        df_grouped = flatten_campaigns(campaign_stats)
+        df_grouped['Project'] = project_name
+
+        # Fetch product history for every product that had advertising
+        unique_nmId_values = df_grouped['nmId'].unique().tolist()
+        print(f"Total unique nmId values for {project_name}:", len(unique_nmId_values))
+        history = await client.fetch_history(unique_nmId_values, period)
 
-                json_data = json.dumps(request_body, ensure_ascii=False)
-
-                # Send the POST request with timeout
-                response = requests.post(
-                    url,
-                    headers=headers,
-                    data=json_data,
-                    timeout=request_timeout
-                )
-
-                # Handle rate limiting (429 status code)
-                if response.status_code == 429:
-                    wait_time = int(response.headers.get('Retry-After', retry_delay))
-                    print(f"Rate limit exceeded for {project_name}. Waiting {wait_time} seconds...")
-                    time.sleep(wait_time)
-                    continue
-
-                # Check for successful response
-                if response.status_code != 200:
-                    print(f"Request failed with status code {response.status_code} for {project_name}, page {page}")
-                    print("Response text:", response.text)
-                    if attempt == max_retries - 1:
-                        return all_data
-                    time.sleep(retry_delay)
-                    continue
-
-                data = response.json()
-
-                # Validate response structure
-                if not data.get('data') or not isinstance(data['data'].get('cards'), list):
-                    print(f"Invalid data structure received for {project_name}, page {page}")
-                    return all_data
-
-                cards = data['data']['cards']
-
-                # Check if we have any data
-                if not cards:
-                    print(f"No more data available for {project_name}")
-                    return all_data
-
-                all_data.extend(cards)
-                print(f"Page {page} retrieved successfully for {project_name} (got {len(cards)} items)")
-
-                # Check if there are more pages (using isNextPage flag)
-                if not data['data'].get('isNextPage', False):
-                    print(f"Reached last page for {project_name}")
-                    return all_data
-
-                # Prepare for next page
-                page += 1
-                time.sleep(5)  # Reduced delay between pages to 5 seconds
-                break  # Success, break out of retry loop
-
-            except requests.exceptions.RequestException as e:
-                print(f"Request failed for {project_name}, page {page}: {str(e)}")
-                if attempt == max_retries - 1:
-                    return all_data
-                time.sleep(retry_delay)
-                continue
-            except Exception as e:
-                print(f"Unexpected error for {project_name}, page {page}: {str(e)}")
-                return all_data
+    return campaigns, df_grouped, history
 
 # Function to flatten and group campaign data
 def flatten_campaigns(data):
-    flattened_data = []
-    for entry in data:
-        advertId = entry.get("advertId")  # Extract the advertId
-        for day in entry.get("days", []):
-            date = day.get("date")
-            for app in day.get("apps", []):
-                for nm in app.get("nm", []):
-                    flattened_data.append({
-                        "date": date,
-                        "nmId": nm.get("nmId"),
-                        "name": nm.get("name"),
-                        "views": nm.get("views"),
-                        "clicks": nm.get("clicks"),
-                        "ctr": nm.get("ctr"),
-                        "cpc": nm.get("cpc"),
-                        "sum": nm.get("sum"),
-                        "atbs": nm.get("atbs"),
-                        "orders": nm.get("orders"),
-                        "cr": nm.get("cr"),
-                        "shks": nm.get("shks"),
-                        "sum_price": nm.get("sum_price"),
-                        "advertId": advertId  # Add advertId to each row
-                    })
-    df = pd.DataFrame(flattened_data)
-    df["date"] = pd.to_datetime(df["date"])
-    df["date"] = df["date"].dt.tz_localize(None)
-
-    # Group by 'date' (day only) and 'nmId', summing numeric columns except 'advertId'
-    df_grouped = (
-        df.groupby([df["date"].dt.date, "nmId", "advertId"], as_index=False)
-        .agg({
-            "date": "first",  # Keep the first date (to retain the day)
-            "name": "first",  # Keep the first name (or customize this logic)
-            "views": "sum",
-            "clicks": "sum",
-            "ctr": "mean",  # Sum or average, depending on your needs
-            "cpc": "mean",  # Use mean for 'cpc' (cost per click)
-            "sum": "sum",
-            "atbs": "sum",
-            "orders": "sum",
-            "cr": "mean",  # Use mean for 'cr' (conversion rate)
-            "shks": "sum",
-            "sum_price": "sum",
-            "advertId": "first"  # Keep the first 'advertId' (no summing)
-        })
-    )
+    # Columnar flattening, then sums per (day, nmId, advertId) with ctr/cpc/cr derived from them
+    df_grouped = aggregate_fullstats(flatten_fullstats(data))
     # Rename the 'date' column to 'day' for clarity
     df_grouped.rename(columns={"date": "day"}, inplace=True)
     return df_grouped
@@ -267,45 +92,22 @@ def flatten_json_current_period(cards):
     return flattened_data
 
 # Function to insert data into ClickHouse
-def insert_into_clickhouse(client, table_name, data, columns):
-    #client.insert(table_name, data, column_names=columns)
+def insert_into_clickhouse(client, table_name, df, columns, column_types=None):
+    #insert_dataframe(client, table_name, df, columns, column_types)
     print("Data inserted successfully!")
 
 # Main function to execute the script
 def main():
-    # Define API endpoints
-    campaign_count_url = 'https://advert-api.wildberries.ru/adv/v1/promotion/count'
-    campaign_details_url = "https://advert-api.wildberries.ru/adv/v1/promotion/adverts"
-    campaign_statistics_url = 'https://advert-api.wildberries.ru/adv/v2/fullstats'
-    product_statistics_url = 'https://seller-analytics-api.wildberries.ru/api/v2/nm-report/detail'
-
-    # Fetch campaign data for each project
-    df_guten = fetch_campaign_data(campaign_count_url, headers_guten, 'WB-GutenTech')
-    df_giper = fetch_campaign_data(campaign_count_url, headers_giper, 'WB-ГиперМаркет')
-    df_kitchen = fetch_campaign_data(campaign_count_url, headers_kitchen, 'WB-KitchenAid')
-    df_smart = fetch_campaign_data(campaign_count_url, headers_smart, 'WB-Smart-Market')
-
-    # Fetch campaign details for each project
-    campaigns_guten = fetch_campaign_details(campaign_details_url, headers_guten, 'WB-GutenTech', df_guten['advertId'].tolist())
-    campaigns_giper = fetch_campaign_details(campaign_details_url, headers_giper, 'WB-ГиперМаркет', df_giper['advertId'].tolist())
-    campaigns_kitchen = fetch_campaign_details(campaign_details_url, headers_kitchen, 'WB-KitchenAid', df_kitchen['advertId'].tolist())
-    campaigns_smart = fetch_campaign_details(campaign_details_url, headers_smart, 'WB-Smart-Market', df_smart['advertId'].tolist())
-
-    # Sort each DataFrame by 'createTime' in descending order
-    campaigns_guten = campaigns_guten.sort_values(by='createTime', ascending=False)
-    campaigns_giper = campaigns_giper.sort_values(by='createTime', ascending=False)
-    campaigns_kitchen = campaigns_kitchen.sort_values(by='createTime', ascending=False)
-    campaigns_smart = campaigns_smart.sort_values(by='createTime', ascending=False)
-
-    # Add the 'Project' column to each DataFrame before concatenation
-    campaigns_guten['Project'] = 'WB-GutenTech'
-    campaigns_giper['Project'] = 'WB-ГиперМаркет'
-    campaigns_kitchen['Project'] = 'WB-KitchenAid'
-    campaigns_smart['Project'] = 'WB-Smart-Market'
+    parser = argparse.ArgumentParser(description="Daily WB advertising statistics")
+    parser.add_argument('--sequential', action='store_true', help="process cabinets one after another")
+    args = parser.parse_args()
+
+    # Run the fetch -> flatten -> aggregate chain of every cabinet concurrently
+    results = asyncio.run(run_projects(fetch_project_data, project_keys, concurrent=not args.sequential,
+                                   max_concurrency=max_concurrency()))
 
     # Combine all campaign data
-    combined_campaigns = pd.concat([campaigns_guten, campaigns_giper, campaigns_kitchen, campaigns_smart], ignore_index=True)
-    combined_campaigns['Marketplace'] = 'Wildberries'
+    combined_campaigns = pd.concat([campaigns for campaigns, _, _ in results.values()], ignore_index=True)
     print("Columns in combined_campaigns:", combined_campaigns.columns.tolist())
 
     # Keep only the desired columns
@@ -342,25 +144,8 @@ def main():
     # Display the updated DataFrame
     filtered_df
 
-    # Fetch campaign statistics using get_report
-    all_campaign_data_guten = get_report(campaign_statistics_url, headers_guten, yesterday_start, yesterday_end, 1, 'WB-GutenTech')
-    all_campaign_data_giper = get_report(campaign_statistics_url, headers_giper, yesterday_start, yesterday_end, 1, 'WB-ГиперМаркет')
-    all_campaign_data_kitchen = get_report(campaign_statistics_url, headers_kitchen, yesterday_start, yesterday_end, 1, 'WB-KitchenAid')
-    all_campaign_data_smart = get_report(campaign_statistics_url, headers_smart, yesterday_start, yesterday_end, 1, 'WB-Smart-Market')
-
-    # Flatten the campaign statistics data
-    df_grouped_guten = flatten_campaigns(all_campaign_data_guten)
-    df_grouped_giper = flatten_campaigns(all_campaign_data_giper)
-    df_grouped_kitchen = flatten_campaigns(all_campaign_data_kitchen)
-    df_grouped_smart = flatten_campaigns(all_campaign_data_smart)
-
-    df_grouped_guten['Project'] = 'WB-GutenTech'
-    df_grouped_giper['Project'] = 'WB-ГиперМаркет'
-    df_grouped_kitchen['Project'] = 'WB-KitchenAid'
-    df_grouped_smart['Project'] = 'WB-Smart-Market'
-
     # Concatenate the DataFrames
-    df_grouped_combined_campaigns = pd.concat([df_grouped_guten, df_grouped_giper, df_grouped_kitchen, df_grouped_smart], ignore_index=True)
+    df_grouped_combined_campaigns = pd.concat([df_grouped for _, df_grouped, _ in results.values()], ignore_index=True)
     df_grouped_combined_campaigns['Marketplace'] = 'Wildberries'
 
     # Merge the grouped DataFrame with the filtered_df to add additional columns
@@ -382,22 +167,9 @@ def main():
         inplace=True
     )
 
-    # Fetch product statistics for each project
-    projects = {
-        'WB-GutenTech': headers_guten,
-        'WB-ГиперМаркет': headers_giper,
-        'WB-KitchenAid': headers_kitchen,
-        'WB-Smart-Market': headers_smart
-    }
-
     dataframes = []
 
-    for project_name, headers in projects.items():
-        filtered_df = df_final[df_final['Project'] == project_name]
-        unique_nmId_values = filtered_df['nmId'].unique().tolist()
-        print(f"Total unique nmId values for {project_name}:", len(unique_nmId_values))
-        all_data = get_report(product_statistics_url, headers, specific_date, specific_date, 1, project_name)
-
+    for project_name, (_, _, all_data) in results.items():
         # Flatten the nested 'history' data for easier analysis
         flattened_data = []
         for item in all_data:
@@ -433,10 +205,10 @@ def main():
 
     # Convert 'day' and 'dt' to datetime for accurate merging
     df_final_copy['day'] = pd.to_datetime(df_final_copy['day']).dt.date
-    df_copy['begin'] = pd.to_datetime(df_copy['begin']).dt.date
+    df_copy['dt'] = pd.to_datetime(df_copy['dt']).dt.date
 
     # Rename columns in df2 to match df1 for merging
-    df_copy.rename(columns={'nmID': 'nmId', 'begin': 'day'}, inplace=True)
+    df_copy.rename(columns={'nmID': 'nmId', 'dt': 'day'}, inplace=True)
 
     # Merge the DataFrames on 'nmId', 'day', and 'Project'
     merged_df_2 = pd.merge(
@@ -446,42 +218,23 @@ def main():
         how='left'
     )
 
-    # Fill NaN values with 0 for ordersCount and ordersSumRub
-    merged_df_2['ordersCount'].fillna(0, inplace=True)
-    merged_df_2['ordersSumRub'].fillna(0, inplace=True)
-    merged_df_2['addToCartCount'].fillna(0, inplace=True)
+    # Products without funnel data on the day count as zero orders
+    funnel_columns = ['ordersCount', 'ordersSumRub', 'addToCartCount']
+    merged_df_2[funnel_columns] = merged_df_2[funnel_columns].fillna(0)
 
     # Insert data into ClickHouse
-    client = get_client(
-        host='rc1a-j5ou9lq30ldal602.mdb.yandexcloud.net',
-        port=8443,
-        username='user1',
-        password=password,
-        database='user1',
-        secure=True,
-        verify=False
-    )
-
-    # Ensure date columns are in the correct format for ClickHouse
-    merged_df_2['day'] = pd.to_datetime(merged_df_2['day'])  # Convert to datetime
+    client = get_clickhouse_client()
 
     # Debugging: Check the data types of the DataFrame
     print("Data types of merged_df:")
     print(merged_df_2.dtypes)
 
-    table_name = 'campaign_data_wb'
-    columns = [
-        'nmId', 'day', 'name_product', 'views', 'clicks', 'sum', 'atbs', 'orders', 'shks',
-        'sum_price', 'advertId', 'Project', 'Marketplace', 'endTime', 'createTime', 'startTime',
-        'name_campaign', 'status', 'type', 'ordersCount', 'ordersSumRub', 'addToCartCount'
-    ]
-    # Reorder columns to match the expected order
-    merged_df_2 = merged_df_2[columns]
-
-    data = [tuple(row) for row in merged_df_2[columns].to_numpy()]
+    # Select and cast the columns of campaign_data_wb in insert order
+    merged_df_2 = CAMPAIGN_DATA_WB.cast(merged_df_2)
 
     # Debugging: Check the structure of the data
-    insert_into_clickhouse(client, table_name, data, columns)
+    insert_into_clickhouse(client, CAMPAIGN_DATA_WB.table, merged_df_2, CAMPAIGN_DATA_WB.names,
+                           CAMPAIGN_DATA_WB.types)
     print(merged_df_2.head())
 
 if __name__ == "__main__":
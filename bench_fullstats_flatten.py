@@ -0,0 +1,114 @@
+"""Benchmark of flatten_fullstats against the former nested-loop flattener.
+
+Builds a synthetic /adv/v2/fullstats payload, checks that both flatteners
+return the same frame and prints the timings.
+
+Usage:
+    python bench_fullstats_flatten.py --campaigns 500 --days 7 --apps 3 --products 40
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+
+from wb_fullstats import flatten_fullstats
+
+
+# Function to flatten the payload the way the scripts did before
+def flatten_loops(campaign_data):
+    flattened_data = []
+    for entry in campaign_data:
+        advertId = entry.get("advertId")
+        for day in entry.get("days", []):
+            date = day.get("date")
+            for app in day.get("apps", []):
+                for nm in app.get("nm", []):
+                    flattened_data.append({
+                        "date": date, "nmId": nm.get("nmId"), "name": nm.get("name"),
+                        "views": nm.get("views"), "clicks": nm.get("clicks"), "ctr": nm.get("ctr"),
+                        "cpc": nm.get("cpc"), "sum": nm.get("sum"), "atbs": nm.get("atbs"),
+                        "orders": nm.get("orders"), "cr": nm.get("cr"), "shks": nm.get("shks"),
+                        "sum_price": nm.get("sum_price"), "advertId": advertId,
+                    })
+    return pd.DataFrame(flattened_data)
+
+
+# Function to build a synthetic fullstats response
+def make_payload(campaigns, days, apps, products, seed=42):
+    rng = random.Random(seed)
+    first_day = date(2024, 12, 1)
+    payload = []
+    for advert_id in range(100000, 100000 + campaigns):
+        payload.append({
+            "advertId": advert_id,
+            "days": [
+                {
+                    "date": f"{first_day + timedelta(days=d)}T00:00:00+03:00",
+                    "apps": [
+                        {
+                            "appType": app_type,
+                            "nm": [
+                                {
+                                    "nmId": 1000000 + rng.randrange(products * 5),
+                                    "name": f"Product {p}",
+                                    "views": rng.randrange(5000),
+                                    "clicks": rng.randrange(200),
+                                    "ctr": round(rng.random() * 5, 2),
+                                    "cpc": round(rng.random() * 30, 2),
+                                    "sum": round(rng.random() * 3000, 2),
+                                    "atbs": rng.randrange(50),
+                                    "orders": rng.randrange(20),
+                                    "cr": round(rng.random() * 10, 2),
+                                    "shks": rng.randrange(20),
+                                    "sum_price": rng.randrange(100000)
+                                }
+                                for p in range(products)
+                            ]
+                        }
+                        for app_type in range(1, apps + 1)
+                    ]
+                }
+                for d in range(days)
+            ]
+        })
+    return payload
+
+
+# Function to return the best wall time of several runs
+def best_time(func, payload, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(payload)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fullstats flattening")
+    parser.add_argument('--campaigns', type=int, default=500)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--apps', type=int, default=3)
+    parser.add_argument('--products', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    payload = make_payload(args.campaigns, args.days, args.apps, args.products)
+    rows = args.campaigns * args.days * args.apps * args.products
+    print(f"Synthetic payload: {args.campaigns} campaigns x {args.days} days x {args.apps} apps "
+          f"x {args.products} products = {rows} rows")
+
+    # Both flatteners must return the same frame
+    pd.testing.assert_frame_equal(flatten_loops(payload), flatten_fullstats(payload))
+
+    loops = best_time(flatten_loops, payload, args.repeat)
+    columnar = best_time(flatten_fullstats, payload, args.repeat)
+    print(f"nested loops:      {loops:.3f} s")
+    print(f"flatten_fullstats: {columnar:.3f} s")
+    print(f"speedup:           {loops / columnar:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
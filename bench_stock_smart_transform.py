@@ -0,0 +1,92 @@
+"""Benchmark of stock_smart.transform_data against the variants it replaced.
+
+Builds a synthetic /report/stock/all payload and times:
+  - the former transform: pd.json_normalize and json.dumps of every row,
+  - pd.json_normalize with the one batch encoding of the payload,
+  - transform_data: the dict flattener with the one batch encoding.
+The metadata_json of every record is checked to decode back to the record
+(without its moment) and both batch variants must return the same frame.
+
+Usage:
+    python bench_stock_smart_transform.py --records 100000
+"""
+import argparse
+import json
+import random
+import time
+
+import pandas as pd
+
+from stock_smart import encode_stocks, split_json_array, transform_data
+
+
+# Function to transform the payload the way the script did before
+def transform_per_row(data):
+    df = pd.json_normalize(data.get('stocks', []))
+    df['metadata_json'] = df.apply(lambda x: json.dumps(x.to_dict()), axis=1)
+    return df
+
+
+# Function to transform the payload with json_normalize and the batch encoding
+def transform_normalize(data):
+    df = pd.json_normalize(data.get('stocks', []))
+    df['metadata_json'] = split_json_array(encode_stocks(data))
+    return df
+
+
+# Function to build a synthetic stock report
+def make_payload(records, seed=42):
+    rng = random.Random(seed)
+    return {'stocks': [
+        {
+            'moment': '2025-06-06T10:00:00+03:00',
+            'assortment': {
+                'type': 'product', 'code': f'C{i}', 'name': f'Товар "{i}", {{размер}} \\ [XL]',
+                'gtin': str(4600000000000 + i), 'brand': 'Brand', 'state': 'active',
+                'folder': 'Одежда/Куртки', 'volume': round(rng.random(), 3)
+            },
+            'stock': {
+                'stock': rng.randrange(100), 'transit': rng.randrange(10), 'reserve': rng.randrange(5),
+                'quantity': rng.randrange(100), 'days': rng.randrange(40), 'cost': round(rng.random() * 1000, 2)
+            }
+        }
+        for i in range(records)
+    ]}
+
+
+# Function to return the best wall time of several runs
+def best_time(func, payload, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(payload)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stock report transform")
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    payload = make_payload(args.records)
+    print(f"Synthetic payload: {args.records} records")
+
+    # Every metadata_json decodes back to its record, and both batch variants agree
+    df = transform_data(payload)
+    expected = [{k: v for k, v in record.items() if k != 'moment'} for record in payload['stocks']]
+    assert [json.loads(value) for value in df['metadata_json']] == expected
+    pd.testing.assert_frame_equal(transform_normalize(payload), df)
+
+    per_row = best_time(transform_per_row, payload, args.repeat)
+    normalize = best_time(transform_normalize, payload, args.repeat)
+    flattener = best_time(transform_data, payload, args.repeat)
+    print(f"json_normalize + per-row json.dumps: {per_row:.3f} s")
+    print(f"json_normalize + batch encoding:     {normalize:.3f} s")
+    print(f"transform_data:                      {flattener:.3f} s")
+    print(f"speedup over the former transform:   {per_row / flattener:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
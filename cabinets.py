@@ -0,0 +1,78 @@
+"""Registry of the seller cabinets every pipeline fans out to.
+
+Cabinets are listed in cabinets.yaml (or the file named by CABINETS_CONFIG)
+with their project names and the name of the .env variable that holds the
+API key. Scripts take {project name: API key} from cabinet_keys() and run
+them through wb_client.run_projects with the configured concurrency cap, so a
+new cabinet needs a config entry and a key, not a code change.
+"""
+import os
+from typing import Dict, List, Tuple
+
+import yaml
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Registry file, overridable per environment
+CONFIG_PATH = os.getenv(
+    'CABINETS_CONFIG',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cabinets.yaml')
+)
+
+
+def load_registry(path: str = None) -> Dict:
+    """Read the raw registry with its settings and cabinet entries"""
+    with open(path or CONFIG_PATH, encoding='utf-8') as f:
+        registry = yaml.safe_load(f) or {}
+    registry.setdefault('settings', {})
+    registry.setdefault('cabinets', [])
+    return registry
+
+
+def load_cabinets(marketplace: str = 'Wildberries', names: List[str] = None, path: str = None) -> List[Dict]:
+    """Return the enabled cabinets of a marketplace with their API keys resolved"""
+    cabinets = []
+    for cabinet in load_registry(path)['cabinets']:
+        if not cabinet.get('enabled', True):
+            continue
+        if marketplace and cabinet.get('marketplace', 'Wildberries') != marketplace:
+            continue
+        if names and cabinet['name'] not in names:
+            continue
+
+        api_key = os.getenv(cabinet['key_env'])
+        if not api_key:
+            print(f"No API key in {cabinet['key_env']} for {cabinet['name']}, skipping")
+            continue
+
+        client_id = os.getenv(cabinet['client_id_env']) if cabinet.get('client_id_env') else None
+        if cabinet.get('client_id_env') and not client_id:
+            print(f"No client id in {cabinet['client_id_env']} for {cabinet['name']}, skipping")
+            continue
+
+        cabinets.append({**cabinet, 'api_key': api_key, 'client_id': client_id})
+    return cabinets
+
+
+def cabinet_keys(name_field: str = 'name', marketplace: str = 'Wildberries', names: List[str] = None,
+                 path: str = None) -> Dict[str, str]:
+    """Return {project name: API key}, naming projects by name_field (e.g. 'finance_name')"""
+    return {
+        cabinet.get(name_field) or cabinet['name']: cabinet['api_key']
+        for cabinet in load_cabinets(marketplace, names, path)
+    }
+
+
+def cabinet_credentials(marketplace: str, names: List[str] = None, path: str = None) -> Dict[str, Tuple[str, str]]:
+    """Return {project name: (client id, API key)} for APIs authenticated by both"""
+    return {
+        cabinet['name']: (cabinet['client_id'], cabinet['api_key'])
+        for cabinet in load_cabinets(marketplace, names, path)
+    }
+
+
+def max_concurrency(path: str = None) -> int:
+    """Number of cabinets a pipeline may process at the same time"""
+    return int(load_registry(path)['settings'].get('max_concurrency', 4))
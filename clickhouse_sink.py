@@ -0,0 +1,158 @@
+"""Columnar ClickHouse inserts shared by every loader.
+
+The scripts used to build [tuple(row) for row in df.to_numpy()] before each
+insert, which turns a mixed-dtype frame into an object array and then boxes
+every cell into Python tuples. ClickHouseSink hands the DataFrame to
+clickhouse_connect column by column instead, with the ClickHouse types of the
+target columns fixed up front and LZ4 compression on the wire.
+
+Column types come from the caller when known, otherwise they are read from
+the table once per sink and reused for every following batch, so repeated
+page inserts do not describe the table again.
+
+For rolling refreshes replace_partitions loads the new rows into a staging
+table and swaps the touched partitions in with REPLACE PARTITION, instead of
+an ALTER ... DELETE mutation followed by an insert.
+
+Usage:
+    client = get_clickhouse_client()
+    insert_dataframe(client, 'campaign_data_wb', df, columns)
+"""
+import os
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+import pandas as pd
+from clickhouse_connect import get_client
+from clickhouse_connect.driver.binding import format_query_value
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Connection parameters of the analytics cluster
+CLICKHOUSE_SETTINGS = {
+    'host': 'rc1a-j5ou9lq30ldal602.mdb.yandexcloud.net',  # Yandex Cloud ClickHouse host
+    'port': 8443,                                          # Yandex Cloud uses port 8443 for HTTPS
+    'username': 'user1',
+    'database': 'user1',
+    'secure': True,                                        # Use HTTPS
+    'verify': False,                                       # Disable SSL certificate verification
+    'compress': 'lz4'                                      # Compress insert blocks on the wire
+}
+
+
+# Function to open a ClickHouse connection with the shared settings
+def get_clickhouse_client(**overrides):
+    settings = {**CLICKHOUSE_SETTINGS, 'password': os.getenv('ClickHouse'), **overrides}
+    return get_client(**settings)
+
+
+class ClickHouseSink:
+    """Columnar inserts of DataFrames into one table"""
+
+    def __init__(self, client, table_name: str, columns: List[str], column_types: Dict[str, str] = None):
+        self.client = client
+        self.table_name = table_name
+        self.columns = list(columns)
+        self.column_types = column_types
+        self.context = None
+
+    def _create_context(self):
+        if self.column_types:
+            # Types given by the caller: no round trip to describe the table
+            return self.client.create_insert_context(
+                self.table_name,
+                self.columns,
+                column_type_names=[self.column_types[col] for col in self.columns]
+            )
+        # Types read from the table once and kept for the following batches
+        return self.client.create_insert_context(self.table_name, self.columns)
+
+    def insert(self, df: pd.DataFrame) -> int:
+        """Insert the sink's columns of df; return the number of rows sent"""
+        if df.empty:
+            return 0
+        if self.context is None:
+            self.context = self._create_context()
+        self.context.data = df[self.columns]
+        self.client.insert(context=self.context)
+        return len(df)
+
+
+# Function to insert a DataFrame in one columnar batch
+def insert_dataframe(client, table_name: str, df: pd.DataFrame, columns: List[str],
+                     column_types: Optional[Dict[str, str]] = None) -> int:
+    return ClickHouseSink(client, table_name, columns, column_types).insert(df)
+
+
+# Function to build a SQL value list such as ('a', 'b') from Python values
+def sql_list(values) -> str:
+    return '(' + ', '.join(format_query_value(value) for value in values) + ')'
+
+
+# Function to list the partition ids of a table holding rows that match where
+def partition_ids(client, table_name: str, where: str = '1') -> set:
+    result = client.query(f"SELECT DISTINCT _partition_id FROM {table_name} WHERE {where}")
+    return {row[0] for row in result.result_rows}
+
+
+# Function to create an empty MergeTree copy of a table with the same partition and sorting keys
+def create_staging_table(client, table_name: str, staging_name: str):
+    keys = client.query(
+        "SELECT partition_key, sorting_key, primary_key FROM system.tables "
+        "WHERE database = currentDatabase() AND name = {table:String}",
+        parameters={'table': table_name}
+    ).first_row
+    partition_key, sorting_key, primary_key = keys
+
+    # Plain MergeTree, so a replicated target never shares its coordination path with the copy
+    engine = f"ENGINE = MergeTree PARTITION BY {partition_key or 'tuple()'} ORDER BY ({sorting_key or 'tuple()'})"
+    if primary_key and primary_key != sorting_key:
+        engine += f" PRIMARY KEY ({primary_key})"
+
+    client.command(f"DROP TABLE IF EXISTS {staging_name}")
+    client.command(f"CREATE TABLE {staging_name} AS {table_name} {engine}")
+
+
+# Function to replace the rows matched by replace_where with df, one whole partition at a time
+def replace_partitions(client, table_name: str, df: pd.DataFrame, columns: List[str], replace_where: str,
+                       column_types: Optional[Dict[str, str]] = None) -> int:
+    """Swap in df for the target rows matched by replace_where without a DELETE mutation.
+
+    df is written to a staging table with the same partition key. Rows of the
+    touched partitions that replace_where does not cover (other days of a
+    monthly partition, cabinets that failed this run) are copied into the
+    staging table too, and every touched partition is then swapped in with
+    REPLACE PARTITION. Readers see either the old or the new partition, never
+    a gap or duplicates, and re-running the load gives the same result.
+
+    Every call stages into its own uniquely named table, so loads into the
+    same target running at the same time never share or drop each other's
+    staged rows.
+    """
+    staging_name = f"{table_name}_staging_{uuid4().hex[:8]}"
+    try:
+        create_staging_table(client, table_name, staging_name)
+        inserted = ClickHouseSink(client, staging_name, columns, column_types).insert(df)
+
+        # Partitions that receive new rows or lose rows being replaced
+        affected = partition_ids(client, staging_name) | partition_ids(client, table_name, replace_where)
+        if not affected:
+            return 0
+
+        # Keep the rows of those partitions that this load does not replace
+        client.command(
+            f"INSERT INTO {staging_name} SELECT * FROM {table_name} "
+            f"WHERE _partition_id IN {sql_list(sorted(affected))} AND NOT ({replace_where})"
+        )
+
+        staged = partition_ids(client, staging_name)
+        commands = [f"REPLACE PARTITION ID {format_query_value(pid)} FROM {staging_name}" for pid in sorted(staged)]
+        # Partitions whose rows were all replaced by nothing
+        commands += [f"DROP PARTITION ID {format_query_value(pid)}" for pid in sorted(affected - staged)]
+        client.command(f"ALTER TABLE {table_name} " + ', '.join(commands))
+        print(f"Replaced {len(affected)} partitions of {table_name} with {inserted} rows")
+        return inserted
+    finally:
+        client.command(f"DROP TABLE IF EXISTS {staging_name}")
@@ -0,0 +1,89 @@
+"""Shared async client for the MoySklad JSON API (api.moysklad.ru).
+
+One MoySkladClient per account keeps a pooled keep-alive aiohttp session.
+The session asks for gzip, which MoySklad expects from API clients and which
+shrinks the large report pages several times. Before every request the
+client takes a token from the shared rate limiter, keyed by the account
+token. MoySklad also caps the number of requests running at the same time
+per account, so a semaphore keeps at most MAX_PARALLEL_REQUESTS in flight.
+
+Usage:
+    async with MoySkladClient(token, 'MC-Smart') as client:
+        data = await client.get(url_profit_by_product, params={'limit': 1000, 'offset': 0})
+"""
+import asyncio
+import json
+from typing import Dict, Optional
+
+import aiohttp
+
+from rate_limiter import RateLimiter, default_limiter
+
+# API endpoints
+url_remap = 'https://api.moysklad.ru/api/remap/1.2'
+url_profit_by_product = f'{url_remap}/report/profit/byproduct'
+
+# Parallel requests MoySklad accepts per account
+MAX_PARALLEL_REQUESTS = 5
+
+
+class MoySkladError(Exception):
+    """Raised when MoySklad rejects a request"""
+
+
+class MoySkladClient:
+    """Pooled gzip session for one MoySklad account"""
+
+    def __init__(self, token: str, project_name: str, timeout: int = 120, limiter: RateLimiter = None):
+        self.token = token
+        self.project_name = project_name
+        self.timeout = timeout
+        self.limiter = limiter or default_limiter
+        self.parallel = asyncio.Semaphore(MAX_PARALLEL_REQUESTS)
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=MAX_PARALLEL_REQUESTS, keepalive_timeout=120),
+            headers={'Authorization': self.token, 'Accept-Encoding': 'gzip', 'Content-Type': 'application/json'},
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def get(self, url: str, params: Dict = None, max_retries: int = 5, retry_delay: int = 5) -> Dict:
+        """GET a resource and return the parsed response, retrying on network errors, 429 and 5xx"""
+        for attempt in range(max_retries):
+            await self.limiter.acquire(url, self.token)
+            try:
+                async with self.parallel:
+                    async with self.session.get(url, params=params) as response:
+                        text = await response.text()
+                        status = response.status
+                        headers = response.headers
+                self.limiter.update(url, self.token, status, headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Request failed for {self.project_name}: {str(e)}")
+                if attempt == max_retries - 1:
+                    raise
+                await asyncio.sleep(retry_delay)
+                continue
+
+            if status == 429:
+                # MoySklad tells how long to wait in milliseconds
+                wait = float(headers.get('X-Lognex-Retry-After') or retry_delay * 1000) / 1000
+                print(f"Rate limit exceeded for {self.project_name}. Retrying in {wait:.1f} seconds...")
+                await asyncio.sleep(wait)
+                continue
+            if status >= 500 and attempt < max_retries - 1:
+                print(f"Server error {status} for {self.project_name}. Retrying in {retry_delay} seconds...")
+                await asyncio.sleep(retry_delay)
+                continue
+            if status != 200:
+                raise MoySkladError(f"GET {url} failed for {self.project_name}: {status} - {text}")
+            return json.loads(text)
+        raise MoySkladError(f"GET {url} failed for {self.project_name} after {max_retries} attempts")
@@ -0,0 +1,116 @@
+"""Paged, concurrent loader of the MoySklad profit-by-product report.
+
+Sells_MC.ipynb read only the first page of report/profit/byproduct for the
+year to date and flattened it row by row with flatten_product_row. Here the
+report is loaded one day at a time, so the table holds daily profit per
+product that sums up to any period. For every day the first page
+(MAX_PAGE_SIZE rows) gives meta.size; the remaining offsets are then
+requested concurrently. All days and pages of an account share one pooled
+gzip session that keeps to MoySklad's per-account limits (see
+moysklad_client).
+
+Pages are flattened column-wise with pd.json_normalize and the
+MOYSKLAD_PROFIT schema. The loaded days of the successful accounts are
+swapped in with replace_partitions, so re-loading a range (documents in
+MoySklad are often edited after the fact) leaves no duplicates.
+
+Usage:
+    python moysklad_profit.py --date-from 2025-01-01 --date-to 2025-06-06
+"""
+import argparse
+import asyncio
+from datetime import date, timedelta
+from typing import Dict, List
+
+import pandas as pd
+
+from cabinets import cabinet_keys, max_concurrency
+from clickhouse_sink import get_clickhouse_client, replace_partitions, sql_list
+from moysklad_client import MoySkladClient, url_profit_by_product
+from schemas import MOYSKLAD_PROFIT
+from wb_client import run_projects
+
+# Rows per page; the API maximum
+MAX_PAGE_SIZE = 1000
+
+
+# Function to build the report parameters of one day and page
+def report_params(day: date, offset: int) -> Dict:
+    return {
+        "limit": MAX_PAGE_SIZE,
+        "offset": offset,
+        "momentFrom": f"{day.isoformat()} 00:00:00",
+        "momentTo": f"{day.isoformat()} 23:59:59"
+    }
+
+
+# Function to flatten report rows into the columns of MOYSKLAD_PROFIT
+def flatten_rows(rows: List[Dict], project_name: str, day: date, load_dt) -> pd.DataFrame:
+    if not rows:
+        return MOYSKLAD_PROFIT.cast(pd.DataFrame())
+    df = pd.json_normalize(rows)
+    if 'assortment.meta.uuidHref' in df.columns:
+        # ...#good/edit?id=<uuid>
+        df['product_uuid'] = df['assortment.meta.uuidHref'].str.split('id=').str[-1]
+    df['project'] = project_name
+    df['date'] = pd.Timestamp(day)
+    df['load_dt'] = load_dt
+    return MOYSKLAD_PROFIT.cast(df)
+
+
+# Function to load every page of the report for each day of the range
+async def process_project(project_name: str, token: str, date_from: date, date_to: date) -> pd.DataFrame:
+    load_dt = pd.Timestamp.now().floor('s')
+    days = [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+
+    async def load_day(client, day: date) -> pd.DataFrame:
+        first = await client.get(url_profit_by_product, params=report_params(day, 0))
+        size = int((first.get('meta') or {}).get('size') or 0)
+        pages = await asyncio.gather(*(client.get(url_profit_by_product, params=report_params(day, offset))
+                                       for offset in range(MAX_PAGE_SIZE, size, MAX_PAGE_SIZE)))
+        rows = (first.get('rows') or []) + [row for page in pages for row in (page.get('rows') or [])]
+        return flatten_rows(rows, project_name, day, load_dt)
+
+    async with MoySkladClient(token, project_name) as client:
+        frames = await asyncio.gather(*(load_day(client, day) for day in days))
+
+    df = pd.concat(frames, ignore_index=True)
+    print(f"{project_name}: {len(df)} rows for {len(days)} days")
+    return df
+
+
+def main():
+    yesterday = date.today() - timedelta(days=1)
+    parser = argparse.ArgumentParser(description="Load the MoySklad profit-by-product report into ClickHouse")
+    parser.add_argument('--date-from', type=date.fromisoformat, default=yesterday - timedelta(days=6))
+    parser.add_argument('--date-to', type=date.fromisoformat, default=yesterday)
+    parser.add_argument('--projects', nargs='*', help="account names to load (default: every MoySklad account)")
+    args = parser.parse_args()
+
+    accounts = cabinet_keys(marketplace='MoySklad', names=args.projects)
+    results = asyncio.run(run_projects(
+        lambda project_name, token: process_project(project_name, token, args.date_from, args.date_to),
+        accounts,
+        max_concurrency=max_concurrency()
+    ))
+    if not results:
+        print("No data to insert")
+        return
+
+    # Replace the loaded days of the accounts that succeeded; failed accounts keep their rows
+    df = pd.concat(results.values(), ignore_index=True)
+    replace_where = (
+        f"date >= '{args.date_from}' AND date <= '{args.date_to}' "
+        f"AND project IN {sql_list(results.keys())}"
+    )
+    ch_client = get_clickhouse_client()
+    try:
+        inserted = replace_partitions(ch_client, MOYSKLAD_PROFIT.table, df, MOYSKLAD_PROFIT.names,
+                                      replace_where, MOYSKLAD_PROFIT.types)
+    finally:
+        ch_client.close()
+    print(f"Replaced {args.date_from} to {args.date_to} of {MOYSKLAD_PROFIT.table} with {inserted} rows")
+
+
+if __name__ == "__main__":
+    main()
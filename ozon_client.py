@@ -0,0 +1,80 @@
+"""Shared async client for the Ozon Seller API (api-seller.ozon.ru).
+
+Like WBClient for Wildberries, one OzonSellerClient per seller cabinet keeps
+a pooled keep-alive aiohttp session and takes a token from the shared rate
+limiter before every request, keyed by the cabinet's Client-Id, so
+concurrent shards and pages of one cabinet stay within its quota while
+other cabinets run in parallel.
+
+Usage:
+    async with OzonSellerClient(client_id, api_key, 'Ozon-GUTENTECH-1547') as client:
+        data = await client.post(url_transaction_list, json=body)
+"""
+import asyncio
+import json
+from typing import Dict, Optional
+
+import aiohttp
+
+from rate_limiter import RateLimiter, default_limiter
+
+# API endpoints
+url_seller = 'https://api-seller.ozon.ru'
+url_transaction_list = f'{url_seller}/v3/finance/transaction/list'
+url_realization_by_day = f'{url_seller}/v1/finance/realization/by-day'
+
+
+class OzonSellerError(Exception):
+    """Raised when the Seller API rejects a request"""
+
+
+class OzonSellerClient:
+    """Pooled keep-alive session for one Ozon seller cabinet"""
+
+    def __init__(self, client_id: str, api_key: str, project_name: str, limit_per_host: int = 8,
+                 timeout: int = 120, limiter: RateLimiter = None):
+        self.client_id = client_id
+        self.api_key = api_key
+        self.project_name = project_name
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.limiter = limiter or default_limiter
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=self.limit_per_host, keepalive_timeout=120),
+            headers={'Client-Id': self.client_id, 'Api-Key': self.api_key, 'Content-Type': 'application/json'},
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def post(self, url: str, json_body: Dict = None, max_retries: int = 5, retry_delay: int = 5) -> Dict:
+        """POST a JSON body and return the parsed response, retrying on network errors, 429 and 5xx"""
+        for attempt in range(max_retries):
+            await self.limiter.acquire(url, self.client_id)
+            try:
+                async with self.session.post(url, json=json_body) as response:
+                    text = await response.text()
+                    status = response.status
+                    self.limiter.update(url, self.client_id, status, response.headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Request failed for {self.project_name}: {str(e)}")
+                if attempt == max_retries - 1:
+                    raise
+                await asyncio.sleep(retry_delay)
+                continue
+
+            if status == 429 or (status >= 500 and attempt < max_retries - 1):
+                print(f"Status {status} for {self.project_name} on {url}. Retrying in {retry_delay * (attempt + 1)} seconds...")
+                await asyncio.sleep(retry_delay * (attempt + 1))
+                continue
+            if status != 200:
+                raise OzonSellerError(f"POST {url} failed for {self.project_name}: {status} - {text}")
+            return json.loads(text)
+        raise OzonSellerError(f"POST {url} failed for {self.project_name} after {max_retries} attempts")
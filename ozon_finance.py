@@ -0,0 +1,158 @@
+"""Month-sharded, concurrent loader of Ozon finance transactions.
+
+Ozon_expenses.ipynb posted one 30-day window to /v3/finance/transaction/list
+per cabinet and read only the first page. The endpoint accepts at most one
+month per request and pages by page/page_size, so here an arbitrary range is
+split into calendar-month shards; every shard asks for its first page to
+learn page_count and then fetches the remaining pages concurrently. All
+shards and pages of all cabinets run at once, paced per Client-Id by the
+shared rate limiter.
+
+Pages are flattened and inserted into ozon_finance as they arrive. Rows are
+deduplicated on operation_id: against the ids already stored for the
+shard's dates in ClickHouse (so re-running a range does not duplicate it)
+and against the ids inserted earlier in the same run.
+
+Usage:
+    python ozon_finance.py --date-from 2024-01-01 --date-to 2024-12-31
+"""
+import argparse
+import asyncio
+from datetime import date, timedelta
+from typing import Dict, List, Set, Tuple
+
+import pandas as pd
+
+from cabinets import cabinet_credentials, max_concurrency
+from clickhouse_sink import ClickHouseSink, get_clickhouse_client
+from ozon_client import OzonSellerClient, url_transaction_list
+from schemas import OZON_FINANCE
+from wb_client import run_projects
+
+# Operations per page; the API maximum
+PAGE_SIZE = 1000
+
+
+# Function to split [date_from, date_to] into calendar-month shards
+def month_shards(date_from: date, date_to: date) -> List[Tuple[date, date]]:
+    shards = []
+    begin = date_from
+    while begin <= date_to:
+        next_month = (begin.replace(day=1) + timedelta(days=32)).replace(day=1)
+        end = min(next_month - timedelta(days=1), date_to)
+        shards.append((begin, end))
+        begin = end + timedelta(days=1)
+    return shards
+
+
+# Function to build the transaction/list request of one shard page
+def transaction_request(begin: date, end: date, page: int) -> Dict:
+    return {
+        "filter": {
+            "date": {
+                "from": f"{begin.isoformat()}T00:00:00.000Z",
+                "to": f"{end.isoformat()}T23:59:59.999Z"
+            },
+            "operation_type": [],
+            "posting_number": "",
+            "transaction_type": "all"
+        },
+        "page": page,
+        "page_size": PAGE_SIZE
+    }
+
+
+# Function to flatten operations into ozon_finance rows (first item and first service of each operation)
+def flatten_operations(operations: List[Dict], project_name: str) -> pd.DataFrame:
+    if not operations:
+        return OZON_FINANCE.cast(pd.DataFrame())
+    df = pd.json_normalize(operations)
+
+    # .map instead of .str: when every list of a page is empty the column holds no
+    # strings, lists or dicts at all and the .str accessor refuses it
+    for prefix, fields in (('items', {'name': 'item_name', 'sku': 'item_sku'}),
+                           ('services', {'name': 'service_name', 'price': 'service_price'})):
+        if prefix in df.columns:
+            first = df[prefix].map(lambda v: v[0] if isinstance(v, list) and v else None)
+        else:
+            first = pd.Series(None, index=df.index, dtype='object')
+        for field, column in fields.items():
+            df[column] = first.map(lambda d: d.get(field) if isinstance(d, dict) else None)
+
+    df['project'] = project_name
+    return OZON_FINANCE.cast(df)
+
+
+# Function to read the operation ids already stored for a cabinet and shard
+def stored_operation_ids(ch_client, project_name: str, begin: date, end: date) -> Set[int]:
+    # A day of margin on both sides: the filter is in UTC, operation_date in local time
+    result = ch_client.query(
+        f"SELECT DISTINCT operation_id FROM {OZON_FINANCE.table} "
+        f"WHERE project = {{project:String}} AND operation_date >= {{begin:Date}} - 1 "
+        f"AND operation_date < {{end:Date}} + 2",
+        parameters={'project': project_name, 'begin': begin, 'end': end}
+    )
+    return {row[0] for row in result.result_rows}
+
+
+# Function to load every transaction of one cabinet in the date range
+async def process_project(project_name: str, credentials, date_from: date, date_to: date) -> int:
+    client_id, api_key = credentials
+    ch_client = get_clickhouse_client()
+    sink = ClickHouseSink(ch_client, OZON_FINANCE.table, OZON_FINANCE.names, OZON_FINANCE.types)
+    ch_lock = asyncio.Lock()  # One query or insert at a time on the cabinet's ClickHouse connection
+    seen: Set[int] = set()
+
+    async def store(operations, known: Set[int]) -> int:
+        df = flatten_operations(operations, project_name)
+        ids = df['operation_id']
+        fresh = ~(ids.isin(known) | ids.isin(seen)) & ~ids.duplicated()
+        df = df[fresh]
+        seen.update(df['operation_id'].tolist())
+        async with ch_lock:
+            return await asyncio.to_thread(sink.insert, df)
+
+    async def load_shard(client, begin: date, end: date) -> int:
+        async with ch_lock:
+            known = await asyncio.to_thread(stored_operation_ids, ch_client, project_name, begin, end)
+
+        first = (await client.post(url_transaction_list, transaction_request(begin, end, 1))).get('result', {})
+        page_count = int(first.get('page_count') or 1)
+        inserted = await store(first.get('operations') or [], known)
+
+        async def load_page(page):
+            result = (await client.post(url_transaction_list, transaction_request(begin, end, page))).get('result', {})
+            return await store(result.get('operations') or [], known)
+
+        inserted += sum(await asyncio.gather(*(load_page(page) for page in range(2, page_count + 1))))
+        print(f"{project_name} {begin}..{end}: {page_count} pages, {inserted} new operations")
+        return inserted
+
+    try:
+        async with OzonSellerClient(client_id, api_key, project_name) as client:
+            totals = await asyncio.gather(*(load_shard(client, begin, end)
+                                            for begin, end in month_shards(date_from, date_to)))
+    finally:
+        ch_client.close()
+    return sum(totals)
+
+
+def main():
+    yesterday = date.today() - timedelta(days=1)
+    parser = argparse.ArgumentParser(description="Load Ozon finance transactions into ozon_finance")
+    parser.add_argument('--date-from', type=date.fromisoformat, default=yesterday - timedelta(days=30))
+    parser.add_argument('--date-to', type=date.fromisoformat, default=yesterday)
+    parser.add_argument('--projects', nargs='*', help="cabinet names to load (default: every Ozon cabinet)")
+    args = parser.parse_args()
+
+    projects = cabinet_credentials('Ozon', names=args.projects)
+    results = asyncio.run(run_projects(
+        lambda project_name, credentials: process_project(project_name, credentials, args.date_from, args.date_to),
+        projects,
+        max_concurrency=max_concurrency()
+    ))
+    print(f"Total operations inserted: {sum(results.values())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Ozon Performance (advertising) statistics loader.
+
+Analytics_Ozon.ipynb fetched a token by hand and then asked for the
+statistics of one campaign at a time, sleeping a minute between status
+checks of each report. Here every cabinet gets one OzonPerformanceClient:
+
+- the bearer token is cached and refreshed shortly before it expires, and
+  once more on a 401, under a lock so concurrent requests share one refresh;
+- campaigns are sent to /api/client/statistics/json in batches of up to
+  STATISTICS_MAX_CAMPAIGNS, at most MAX_ACTIVE_REPORTS reports being
+  generated at a time;
+- every outstanding report UUID is polled concurrently with backoff;
+- each report is flattened and inserted into ClickHouse as soon as it is
+  downloaded, while the other reports are still being generated.
+
+Usage:
+    python ozon_performance.py --date-from 2025-01-01 --date-to 2025-01-07
+"""
+import argparse
+import asyncio
+import json
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import aiohttp
+import pandas as pd
+
+from cabinets import cabinet_credentials, max_concurrency
+from clickhouse_sink import ClickHouseSink, get_clickhouse_client
+from rate_limiter import RateLimiter, default_limiter
+from schemas import OZON_CAMPAIGN_STATS
+from wb_client import run_projects
+
+# API endpoints
+url_performance = 'https://api-performance.ozon.ru'
+url_token = f'{url_performance}/api/client/token'
+url_campaigns = f'{url_performance}/api/client/campaign'
+url_statistics = f'{url_performance}/api/client/statistics/json'
+url_report_state = f'{url_performance}/api/client/statistics'
+url_report = f'{url_performance}/api/client/statistics/report'
+
+# Campaigns accepted by one statistics request
+STATISTICS_MAX_CAMPAIGNS = 10
+
+# Reports generated at the same time per cabinet; Ozon answers 429 to more
+MAX_ACTIVE_REPORTS = 3
+
+# Refresh the token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 60
+
+
+class OzonAPIError(Exception):
+    """Raised when Ozon rejects a request or a report fails"""
+
+
+class OzonToken:
+    """Bearer token of one client id, refreshed before it expires"""
+
+    def __init__(self, client_id: str, client_secret: str):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.access_token: Optional[str] = None
+        self.expires_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def _valid(self) -> bool:
+        return self.access_token is not None and asyncio.get_running_loop().time() < self.expires_at
+
+    async def get(self, session: aiohttp.ClientSession, force: bool = False) -> str:
+        if not force and self._valid():
+            return self.access_token
+        async with self.lock:
+            # Another request may have refreshed it while this one waited
+            if not force and self._valid():
+                return self.access_token
+            payload = {
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+                'grant_type': 'client_credentials'
+            }
+            async with session.post(url_token, json=payload) as response:
+                text = await response.text()
+                if response.status != 200:
+                    raise OzonAPIError(f"Failed to obtain token: {response.status} - {text}")
+                data = json.loads(text)
+            self.access_token = data['access_token']
+            lifetime = float(data.get('expires_in', 1800))
+            self.expires_at = asyncio.get_running_loop().time() + max(lifetime - TOKEN_REFRESH_MARGIN, 0)
+            return self.access_token
+
+
+class OzonPerformanceClient:
+    """Pooled session with a cached token for one Ozon Performance account"""
+
+    def __init__(self, client_id: str, client_secret: str, project_name: str, timeout: int = 120,
+                 limiter: RateLimiter = None):
+        self.client_id = client_id
+        self.project_name = project_name
+        self.token = OzonToken(client_id, client_secret)
+        self.limiter = limiter or default_limiter
+        self.timeout = timeout
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=8, keepalive_timeout=120),
+            headers={'Content-Type': 'application/json', 'Accept': 'application/json'},
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def request(self, method: str, url: str, max_retries: int = 3, retry_delay: int = 10, **kwargs):
+        """Send an authorized request and return the parsed JSON body"""
+        force_token = False
+        for attempt in range(max_retries):
+            token = await self.token.get(self.session, force=force_token)
+            force_token = False
+            await self.limiter.acquire(url, self.client_id)
+            try:
+                async with self.session.request(method, url, headers={'Authorization': f'Bearer {token}'},
+                                                **kwargs) as response:
+                    text = await response.text()
+                    status = response.status
+                    self.limiter.update(url, self.client_id, status, response.headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Request failed for {self.project_name}: {str(e)}")
+                if attempt == max_retries - 1:
+                    raise
+                await asyncio.sleep(retry_delay)
+                continue
+
+            if status == 401:
+                # Token revoked or expired early: refresh it once and repeat
+                force_token = True
+                continue
+            if status == 429:
+                # Ozon sends no quota headers; back off before the next attempt
+                print(f"Rate limit exceeded for {self.project_name} on {url}. Retrying in {retry_delay} seconds...")
+                await asyncio.sleep(retry_delay * (attempt + 1))
+                continue
+            if status >= 500 and attempt < max_retries - 1:
+                print(f"Server error {status} for {self.project_name}. Retrying in {retry_delay} seconds...")
+                await asyncio.sleep(retry_delay)
+                continue
+            if status != 200:
+                raise OzonAPIError(f"{method} {url} failed for {self.project_name}: {status} - {text}")
+            return json.loads(text) if text else {}
+        raise OzonAPIError(f"{method} {url} failed for {self.project_name} after {max_retries} attempts")
+
+    # Function to list the campaigns of the account
+    async def fetch_campaigns(self, adv_object_type: str = 'SKU') -> pd.DataFrame:
+        data = await self.request('GET', url_campaigns, params={'advObjectType': adv_object_type})
+        return pd.DataFrame(data.get('list') or [])
+
+    # Function to request a statistics report and return its UUID
+    async def request_statistics(self, campaign_ids: List[str], date_from, date_to) -> str:
+        payload = {
+            'campaigns': [str(campaign_id) for campaign_id in campaign_ids],
+            'dateFrom': str(date_from),
+            'dateTo': str(date_to),
+            'groupBy': 'DATE'
+        }
+        data = await self.request('POST', url_statistics, json=payload)
+        uuid = data.get('UUID') or data.get('report_id')
+        if not uuid:
+            raise OzonAPIError(f"No report UUID for {self.project_name}: {data}")
+        return uuid
+
+    # Function to wait until a statistics report is generated
+    async def wait_report(self, uuid: str, first_delay: float = 5, max_delay: float = 60,
+                          timeout: float = 1800) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        delay = first_delay
+        while True:
+            await asyncio.sleep(min(delay, max(deadline - loop.time(), 0)))
+            state = (await self.request('GET', f'{url_report_state}/{uuid}')).get('state')
+            if state == 'OK':
+                return
+            if state == 'ERROR':
+                raise OzonAPIError(f"Report {uuid} of {self.project_name} failed")
+            if loop.time() >= deadline:
+                raise OzonAPIError(f"Report {uuid} of {self.project_name} not ready after {timeout} s "
+                                   f"(last state: {state})")
+            delay = min(delay * 2, max_delay)
+
+    # Function to download a generated statistics report
+    async def download_report(self, uuid: str) -> Dict:
+        return await self.request('GET', url_report, params={'UUID': uuid})
+
+
+# Function to turn "1 234,56"-style numbers into floats
+def parse_number(values: pd.Series) -> pd.Series:
+    cleaned = values.astype('string').str.replace('\xa0', '', regex=False).str.replace(' ', '', regex=False)
+    return pd.to_numeric(cleaned.str.replace(',', '.', regex=False), errors='coerce')
+
+
+# Function to flatten a JSON statistics report into one row per campaign, day and SKU
+def flatten_report(report: Dict, project_name: str, load_dt) -> pd.DataFrame:
+    frames = []
+    for campaign_id, campaign in report.items():
+        rows = (campaign.get('report') or {}).get('rows') or []
+        if not rows:
+            continue
+        df = pd.DataFrame(rows)
+        df['campaign_id'] = campaign_id
+        df['campaign_title'] = campaign.get('title')
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=OZON_CAMPAIGN_STATS.names)
+
+    df = pd.concat(frames, ignore_index=True)
+    for column in OZON_CAMPAIGN_STATS.columns:
+        if column.source in df.columns and column.ch_type.startswith(('Int', 'UInt', 'Float')):
+            df[column.source] = parse_number(df[column.source])
+    if 'date' in df.columns:
+        # Report days come as DD.MM.YYYY
+        df['date'] = pd.to_datetime(df['date'], format='%d.%m.%Y', errors='coerce')
+
+    df['Project'] = project_name
+    df['Marketplace'] = 'Ozon'
+    df['load_dt'] = load_dt
+    return OZON_CAMPAIGN_STATS.cast(df)
+
+
+# Function to load the statistics of every campaign of one account
+async def process_project(project_name: str, credentials, date_from, date_to) -> int:
+    client_id, client_secret = credentials
+    load_dt = pd.Timestamp.now()
+    ch_client = get_clickhouse_client()
+    sink = ClickHouseSink(ch_client, OZON_CAMPAIGN_STATS.table, OZON_CAMPAIGN_STATS.names, OZON_CAMPAIGN_STATS.types)
+    insert_lock = asyncio.Lock()  # One insert at a time on the cabinet's ClickHouse connection
+    active_reports = asyncio.Semaphore(MAX_ACTIVE_REPORTS)
+
+    try:
+        async with OzonPerformanceClient(client_id, client_secret, project_name) as client:
+            campaigns = await client.fetch_campaigns()
+            if campaigns.empty:
+                print(f"No campaigns for {project_name}")
+                return 0
+            # Campaigns created after the period cannot have statistics in it
+            if 'createdAt' in campaigns.columns:
+                created = pd.to_datetime(campaigns['createdAt'], errors='coerce', utc=True)
+                campaigns = campaigns[~(created.dt.date > date_to)]
+            campaign_ids = campaigns['id'].tolist()
+            batches = [campaign_ids[i:i + STATISTICS_MAX_CAMPAIGNS]
+                       for i in range(0, len(campaign_ids), STATISTICS_MAX_CAMPAIGNS)]
+            print(f"{project_name}: {len(campaign_ids)} campaigns in {len(batches)} reports")
+
+            async def load_batch(batch):
+                async with active_reports:
+                    uuid = await client.request_statistics(batch, date_from, date_to)
+                    await client.wait_report(uuid)
+                    report = await client.download_report(uuid)
+                df = flatten_report(report, project_name, load_dt)
+                async with insert_lock:
+                    return await asyncio.to_thread(sink.insert, df)
+
+            outcomes = await asyncio.gather(*(load_batch(batch) for batch in batches), return_exceptions=True)
+    finally:
+        ch_client.close()
+
+    failed = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    for error in failed:
+        print(f"Report failed for {project_name}: {error}")
+    total = sum(outcome for outcome in outcomes if not isinstance(outcome, BaseException))
+    print(f"Inserted {total} rows into {OZON_CAMPAIGN_STATS.table} for {project_name} "
+          f"({len(failed)} of {len(batches)} reports failed)")
+    return total
+
+
+def main():
+    yesterday = date.today() - timedelta(days=1)
+    parser = argparse.ArgumentParser(description="Load Ozon Performance campaign statistics into ClickHouse")
+    parser.add_argument('--date-from', type=date.fromisoformat, default=yesterday - timedelta(days=2))
+    parser.add_argument('--date-to', type=date.fromisoformat, default=yesterday)
+    args = parser.parse_args()
+
+    projects = cabinet_credentials('OzonPerformance')
+    results = asyncio.run(run_projects(
+        lambda project_name, credentials: process_project(project_name, credentials, args.date_from, args.date_to),
+        projects,
+        max_concurrency=max_concurrency()
+    ))
+    print(f"Total records inserted: {sum(results.values())}")
+
+
+if __name__ == "__main__":
+    main()
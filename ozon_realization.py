@@ -0,0 +1,137 @@
+"""Ozon realization-by-day loader landing day-partitioned Parquet files.
+
+Daily_finance_ozon.ipynb asked /v1/finance/realization/by-day for one day
+after another, flattened every row with a recursive Python helper and wrote
+the result as indented JSON text. Here the days of a range are requested
+concurrently per cabinet (paced per Client-Id by the shared rate limiter),
+each day's rows are flattened column by column with pd.json_normalize and
+cast by the OZON_REALIZATION schema, and the day is written as one
+zstd-compressed Parquet file:
+
+    <lake>/ozon_realization/project=<cabinet>/date=<YYYY-MM-DD>/part.parquet
+
+project and date are carried by the hive-style directory names, so the
+whole landing reads back as one table with read_realization. Days whose
+file already exists are skipped on re-runs unless --force is given; days
+without rows are not written and are asked for again next time. Files are
+written to a temporary name and renamed, so an interrupted run never
+leaves a half-written day behind.
+
+The lake root is LAKE_DIR from the environment, ./lake by default.
+
+Usage:
+    python ozon_realization.py --date-from 2025-04-01 --date-to 2025-04-30
+"""
+import argparse
+import asyncio
+import os
+from datetime import date, timedelta
+from typing import Dict, List
+
+import pandas as pd
+
+from cabinets import cabinet_credentials, max_concurrency
+from ozon_client import OzonSellerClient, url_realization_by_day
+from schemas import OZON_REALIZATION
+from wb_client import run_projects
+
+# Columns stored in the partition directory names rather than in the files
+PARTITION_COLUMNS = ['project', 'date']
+
+
+# Function to return the landing directory of the realization report
+def dataset_dir() -> str:
+    return os.path.join(os.getenv('LAKE_DIR', 'lake'), OZON_REALIZATION.table)
+
+
+# Function to return the Parquet file of one cabinet and day
+def partition_path(project_name: str, day: date) -> str:
+    return os.path.join(dataset_dir(), f"project={project_name}", f"date={day.isoformat()}", 'part.parquet')
+
+
+# Function to flatten the rows of one day into the columns of OZON_REALIZATION
+def flatten_rows(rows: List[Dict], project_name: str, day: date) -> pd.DataFrame:
+    # json_normalize names nested fields 'delivery_commission.amount' etc.; a null
+    # commission block leaves its columns missing, and the schema fills them with nulls
+    df = pd.json_normalize(rows) if rows else pd.DataFrame()
+    df['project'] = project_name
+    df['date'] = pd.Timestamp(day)
+    return OZON_REALIZATION.cast(df)
+
+
+# Function to write one day atomically as compressed Parquet
+def write_day(df: pd.DataFrame, path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    df.drop(columns=PARTITION_COLUMNS).to_parquet(tmp_path, engine='pyarrow', compression='zstd', index=False)
+    os.replace(tmp_path, path)
+
+
+# Function to read the landed days back as one DataFrame
+def read_realization(date_from: date = None, date_to: date = None, projects: List[str] = None) -> pd.DataFrame:
+    filters = []
+    if date_from is not None:
+        filters.append(('date', '>=', date_from.isoformat()))
+    if date_to is not None:
+        filters.append(('date', '<=', date_to.isoformat()))
+    if projects:
+        filters.append(('project', 'in', list(projects)))
+    df = pd.read_parquet(dataset_dir(), engine='pyarrow', filters=filters or None)
+    df['project'] = df['project'].astype('string')
+    df['date'] = pd.to_datetime(df['date'].astype('string'))
+    return df[OZON_REALIZATION.names]
+
+
+# Function to land every missing day of one cabinet in the date range
+async def process_project(project_name: str, credentials, date_from: date, date_to: date,
+                          force: bool = False) -> int:
+    client_id, api_key = credentials
+    days = [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+    if not force:
+        days = [day for day in days if not os.path.exists(partition_path(project_name, day))]
+    if not days:
+        print(f"{project_name}: every day from {date_from} to {date_to} is already stored")
+        return 0
+
+    async def load_day(client, day: date) -> int:
+        result = await client.post(url_realization_by_day, {"day": day.day, "month": day.month, "year": day.year})
+        rows = result.get('rows') or []
+        if not rows:
+            print(f"{project_name} {day}: no rows")
+            return 0
+        df = flatten_rows(rows, project_name, day)
+        await asyncio.to_thread(write_day, df, partition_path(project_name, day))
+        return len(df)
+
+    async with OzonSellerClient(client_id, api_key, project_name) as client:
+        outcomes = await asyncio.gather(*(load_day(client, day) for day in days), return_exceptions=True)
+
+    failed = [(day, outcome) for day, outcome in zip(days, outcomes) if isinstance(outcome, BaseException)]
+    for day, error in failed:
+        print(f"Day {day} failed for {project_name}: {error}")
+    total = sum(outcome for outcome in outcomes if not isinstance(outcome, BaseException))
+    print(f"Stored {total} rows of {len(days) - len(failed)} days for {project_name} ({len(failed)} days failed)")
+    return total
+
+
+def main():
+    yesterday = date.today() - timedelta(days=1)
+    parser = argparse.ArgumentParser(description="Land the Ozon realization-by-day report as Parquet")
+    parser.add_argument('--date-from', type=date.fromisoformat, default=yesterday - timedelta(days=30))
+    parser.add_argument('--date-to', type=date.fromisoformat, default=yesterday)
+    parser.add_argument('--projects', nargs='*', help="cabinet names to load (default: every Ozon cabinet)")
+    parser.add_argument('--force', action='store_true', help="fetch and rewrite days that are already stored")
+    args = parser.parse_args()
+
+    projects = cabinet_credentials('Ozon', names=args.projects)
+    results = asyncio.run(run_projects(
+        lambda project_name, credentials: process_project(project_name, credentials, args.date_from,
+                                                          args.date_to, args.force),
+        projects,
+        max_concurrency=max_concurrency()
+    ))
+    print(f"Total rows stored: {sum(results.values())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Header-driven token-bucket rate limiting for the marketplace APIs.
+
+One TokenBucket is kept per (endpoint, API key). Buckets start from the
+documented quota of the endpoint and are then corrected from the response
+headers WB sends back (X-Ratelimit-Remaining, X-Ratelimit-Retry,
+X-Ratelimit-Limit and Retry-After), so a request waits only as long as the
+server actually requires instead of a fixed sleep.
+"""
+import asyncio
+import time
+from fnmatch import fnmatch
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Documented quotas per endpoint path: (requests, per seconds, burst)
+ENDPOINT_LIMITS = {
+    '/adv/v1/promotion/count': (5, 1, 5),
+    '/adv/v1/promotion/adverts': (5, 1, 5),
+    '/adv/v2/fullstats': (1, 60, 1),
+    '/api/v2/nm-report/detail': (3, 60, 3),
+    '/api/v2/nm-report/detail/history': (3, 60, 3),
+    '/api/v1/warehouse_remains': (1, 60, 1),
+    '/api/v1/warehouse_remains/tasks/*/status': (1, 5, 1),
+    '/api/v1/warehouse_remains/tasks/*/download': (1, 60, 1),
+    '/api/v5/supplier/reportDetailByPeriod': (1, 60, 1),
+    '/api/v1/supplier/orders': (1, 60, 1),
+    # Ozon Seller API, per Client-Id
+    '/v3/finance/transaction/list': (5, 1, 5),
+    '/v1/finance/realization/by-day': (5, 1, 5),
+    # MoySklad, per account token
+    '/api/remap/1.2/report/profit/byproduct': (45, 3, 45),
+}
+
+# Quota for endpoints without a documented limit
+DEFAULT_LIMIT = (10, 1, 10)
+
+
+def endpoint_key(url: str) -> str:
+    """Return the ENDPOINT_LIMITS pattern matching the URL, or its path"""
+    path = urlsplit(url).path
+    for pattern in ENDPOINT_LIMITS:
+        if fnmatch(path, pattern):
+            return pattern
+    return path
+
+
+def _header_float(headers, name: str) -> Optional[float]:
+    value = headers.get(name) if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """Token bucket that can be re-synchronised from server headers"""
+
+    def __init__(self, requests: int, per_seconds: float, burst: int):
+        self.rate = requests / per_seconds  # Tokens added per second
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _try_take(self) -> float:
+        """Take a token if one is free, otherwise return the seconds to wait"""
+        now = time.monotonic()
+        self._refill(now)
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self) -> float:
+        """Wait until a request may be sent; return the total time waited"""
+        waited = 0.0
+        while True:
+            wait = self._try_take()
+            if wait <= 0:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def update(self, status_code: int, headers):
+        """Correct the bucket from the quota headers of a finished response"""
+        now = time.monotonic()
+        self._refill(now)
+
+        limit = _header_float(headers, 'X-Ratelimit-Limit')
+        if limit:
+            self.capacity = limit
+
+        remaining = _header_float(headers, 'X-Ratelimit-Remaining')
+        if remaining is not None:
+            self.tokens = min(self.capacity, remaining)
+
+        retry = _header_float(headers, 'X-Ratelimit-Retry')
+        if retry is None:
+            retry = _header_float(headers, 'Retry-After')
+
+        if status_code == 429:
+            # Server says the quota is spent: wait for its hint or one token interval
+            self.tokens = 0.0
+            self.blocked_until = now + (retry if retry is not None else 1 / self.rate)
+        elif remaining == 0 and retry:
+            self.blocked_until = now + retry
+
+
+class RateLimiter:
+    """Registry of token buckets keyed by (endpoint, API key)"""
+
+    def __init__(self, limits: Dict[str, Tuple[int, float, int]] = None):
+        self.limits = limits if limits is not None else ENDPOINT_LIMITS
+        self.buckets: Dict[Tuple[str, str], TokenBucket] = {}
+
+    def bucket(self, url: str, api_key: str) -> TokenBucket:
+        key = (endpoint_key(url), api_key)
+        if key not in self.buckets:
+            self.buckets[key] = TokenBucket(*self.limits.get(key[0], DEFAULT_LIMIT))
+        return self.buckets[key]
+
+    async def acquire(self, url: str, api_key: str) -> float:
+        return await self.bucket(url, api_key).acquire()
+
+    def update(self, url: str, api_key: str, status_code: int, headers):
+        self.bucket(url, api_key).update(status_code, headers)
+
+
+# Limiter shared by every client in the process
+default_limiter = RateLimiter()
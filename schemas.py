@@ -0,0 +1,393 @@
+"""Declarative schemas of the ClickHouse tables the scripts load.
+
+Each TableSchema lists its columns in insert order with the source column
+(a flat field or a dotted JSON path as produced by pd.json_normalize), the
+ClickHouse type and whether NULL is allowed. TableSchema.cast turns a
+source frame into the insert frame in one pass over the columns: every
+column gets a single vectorized conversion chosen from its type, and the
+result is already in insert order, with the ClickHouse types ready for
+clickhouse_sink.
+
+Usage:
+    df = WB_FINANCE.cast(raw_df)
+    insert_dataframe(client, WB_FINANCE.table, df, WB_FINANCE.names, WB_FINANCE.types)
+"""
+from typing import Dict, List
+
+import pandas as pd
+
+
+class Column:
+    """One target column: name, ClickHouse type, source field and nullability"""
+
+    def __init__(self, name: str, ch_type: str, source: str = None, nullable: bool = False):
+        self.name = name
+        self.ch_type = ch_type
+        self.source = source or name
+        self.nullable = nullable
+
+    @property
+    def full_type(self) -> str:
+        return f'Nullable({self.ch_type})' if self.nullable else self.ch_type
+
+    def cast(self, values: pd.Series) -> pd.Series:
+        """Convert the source values to the dtype matching the ClickHouse type"""
+        if self.ch_type.startswith('Date'):
+            if not pd.api.types.is_datetime64_any_dtype(values):
+                try:
+                    values = pd.to_datetime(values, errors='coerce', format='ISO8601')
+                except ValueError:
+                    # Mixed UTC offsets: keep the wall-clock part of each value
+                    values = pd.to_datetime(values.astype('string').str[:19], errors='coerce', format='ISO8601')
+            if values.dt.tz is not None:
+                values = values.dt.tz_localize(None)  # Keep the wall-clock time of the source
+            return values.dt.normalize() if self.ch_type == 'Date' else values
+
+        if self.ch_type.startswith(('Int', 'UInt')):
+            values = pd.to_numeric(values, errors='coerce')
+            return values.astype('Int64') if self.nullable else values.fillna(0).astype('int64')
+
+        if self.ch_type.startswith('Float'):
+            values = pd.to_numeric(values, errors='coerce')
+            return values.astype('Float64') if self.nullable else values.fillna(0).astype('float64')
+
+        # Strings: empty strings are NULL in nullable columns
+        values = values.astype('string')
+        return values.mask(values == '') if self.nullable else values.fillna('')
+
+
+class TableSchema:
+    """Columns of one ClickHouse table in insert order"""
+
+    def __init__(self, table: str, columns: List[Column]):
+        self.table = table
+        self.columns = columns
+
+    @property
+    def names(self) -> List[str]:
+        return [column.name for column in self.columns]
+
+    @property
+    def types(self) -> Dict[str, str]:
+        return {column.name: column.full_type for column in self.columns}
+
+    def cast(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Select, rename and convert the source columns in one pass; missing sources become NULL/empty"""
+        data = {}
+        for column in self.columns:
+            if column.source in df.columns:
+                values = df[column.source]
+            else:
+                values = pd.Series(None, index=df.index, dtype='object')
+            data[column.name] = column.cast(values)
+        return pd.DataFrame(data, index=df.index)
+
+
+# Realization report fields shared by wb_finance and wb_realization_reports
+REALIZATION_FIELDS = [
+    Column('realizationreport_id', 'Int64'),
+    Column('date_from', 'DateTime'),
+    Column('date_to', 'DateTime'),
+    Column('create_dt', 'DateTime'),
+    Column('currency_name', 'String'),
+    Column('suppliercontract_code', 'String', nullable=True),
+    Column('rrd_id', 'Int64'),
+    Column('gi_id', 'Int64'),
+    Column('dlv_prc', 'Float64'),
+    Column('fix_tariff_date_from', 'DateTime', nullable=True),
+    Column('fix_tariff_date_to', 'DateTime', nullable=True),
+    Column('subject_name', 'String', nullable=True),
+    Column('nm_id', 'Int64'),
+    Column('brand_name', 'String', nullable=True),
+    Column('sa_name', 'String', nullable=True),
+    Column('ts_name', 'String', nullable=True),
+    Column('barcode', 'String', nullable=True),
+    Column('doc_type_name', 'String', nullable=True),
+    Column('quantity', 'Int64'),
+    Column('retail_price', 'Float64'),
+    Column('retail_amount', 'Float64'),
+    Column('sale_percent', 'Float64'),
+    Column('commission_percent', 'Float64'),
+    Column('office_name', 'String', nullable=True),
+    Column('supplier_oper_name', 'String'),
+    Column('order_dt', 'DateTime'),
+    Column('sale_dt', 'DateTime'),
+    Column('rr_dt', 'DateTime'),
+    Column('shk_id', 'Int64'),
+    Column('retail_price_withdisc_rub', 'Float64'),
+    Column('delivery_amount', 'Int64'),
+    Column('return_amount', 'Int64'),
+    Column('delivery_rub', 'Float64'),
+    Column('gi_box_type_name', 'String', nullable=True),
+    Column('product_discount_for_report', 'Float64'),
+    Column('supplier_promo', 'Float64'),
+    Column('rid', 'Int64'),
+    Column('ppvz_spp_prc', 'Float64'),
+    Column('ppvz_kvw_prc_base', 'Float64'),
+    Column('ppvz_kvw_prc', 'Float64'),
+    Column('sup_rating_prc_up', 'Float64'),
+    Column('is_kgvp_v2', 'Float64'),
+    Column('ppvz_sales_commission', 'Float64'),
+    Column('ppvz_for_pay', 'Float64'),
+    Column('ppvz_reward', 'Float64'),
+    Column('acquiring_fee', 'Float64'),
+    Column('acquiring_percent', 'Float64'),
+    Column('payment_processing', 'String', nullable=True),
+    Column('acquiring_bank', 'String', nullable=True),
+    Column('ppvz_vw', 'Float64'),
+    Column('ppvz_vw_nds', 'Float64'),
+    Column('ppvz_office_name', 'String', nullable=True),
+    Column('ppvz_office_id', 'Int64'),
+    Column('ppvz_supplier_id', 'Int64'),
+    Column('ppvz_supplier_name', 'String', nullable=True),
+    Column('ppvz_inn', 'String', nullable=True),
+    Column('declaration_number', 'String', nullable=True),
+    Column('bonus_type_name', 'String', nullable=True),
+    Column('sticker_id', 'String'),
+    Column('site_country', 'String', nullable=True),
+    Column('srv_dbs', 'UInt8'),
+    Column('penalty', 'Float64'),
+    Column('additional_payment', 'Float64'),
+    Column('rebill_logistic_cost', 'Float64'),
+    Column('storage_fee', 'Float64'),
+    Column('deduction', 'Float64'),
+    Column('acceptance', 'Float64'),
+    Column('assembly_id', 'Int64'),
+    Column('srid', 'String', nullable=True),
+    Column('report_type', 'Int64'),
+    Column('is_legal_entity', 'UInt8'),
+    Column('trbx_id', 'String', nullable=True),
+    Column('rebill_logistic_org', 'String', nullable=True),
+    Column('load_dt', 'DateTime'),
+    Column('source', 'String'),
+]
+
+# Realization report of every cabinet (finance_wb)
+WB_FINANCE = TableSchema('wb_finance', REALIZATION_FIELDS + [
+    Column('project', 'String', nullable=True),
+])
+
+# Realization report of WB-Smart-Market (wb_finance_smart)
+WB_REALIZATION_REPORTS = TableSchema('wb_realization_reports', REALIZATION_FIELDS)
+
+# Daily advertising statistics per product and campaign
+CAMPAIGN_DATA_WB = TableSchema('campaign_data_wb', [
+    Column('nmId', 'Int64'),
+    Column('day', 'DateTime'),
+    Column('name_product', 'String'),
+    Column('views', 'Int64'),
+    Column('clicks', 'Int64'),
+    Column('sum', 'Float64'),
+    Column('atbs', 'Int64'),
+    Column('orders', 'Int64'),
+    Column('shks', 'Int64'),
+    Column('sum_price', 'Float64'),
+    Column('advertId', 'Int64'),
+    Column('Project', 'String'),
+    Column('Marketplace', 'String'),
+    Column('endTime', 'Date', nullable=True),
+    Column('createTime', 'Date', nullable=True),
+    Column('startTime', 'Date', nullable=True),
+    Column('name_campaign', 'String', nullable=True),
+    Column('status', 'String', nullable=True),
+    Column('type', 'String', nullable=True),
+    Column('ordersCount', 'Int64'),
+    Column('ordersSumRub', 'Float64'),
+    Column('addToCartCount', 'Int64'),
+])
+
+# Sales funnel per product for one day
+ORDER_HISTORY_WB = TableSchema('order_history_wb', [
+    Column('nmID', 'Int64'),
+    Column('vendorCode', 'String'),
+    Column('brandName', 'String'),
+    Column('objectID', 'Int64'),
+    Column('objectName', 'String'),
+    Column('begin', 'DateTime'),
+    Column('openCardCount', 'Int64'),
+    Column('addToCartCount', 'Int64'),
+    Column('ordersCount', 'Int64'),
+    Column('ordersSumRub', 'Float64'),
+    Column('buyoutsCount', 'Int64'),
+    Column('buyoutsSumRub', 'Float64'),
+    Column('cancelCount', 'Int64'),
+    Column('cancelSumRub', 'Float64'),
+    Column('stocksMp', 'Int64'),
+    Column('stocksWb', 'Int64'),
+    Column('Project', 'String'),
+    Column('Marketplace', 'String'),
+])
+
+# FBO stock per warehouse
+WAREHOUSE_DATA_WB = TableSchema('warehouse_data_wb', [
+    Column('warehouseName', 'String'),
+    Column('quantity', 'Int64'),
+    Column('brand', 'String'),
+    Column('subjectName', 'String'),
+    Column('vendorCode', 'String'),
+    Column('inWayToClient', 'Int64'),
+    Column('inWayFromClient', 'Int64'),
+    Column('quantityWarehousesFull', 'Int64'),
+    Column('Project', 'String'),
+    Column('Date', 'DateTime'),
+    Column('Marketplace', 'String'),
+])
+
+# i-colors stock feed of Smart Market
+STOCKS = TableSchema('stocks', [
+    Column('moment', 'DateTime'),
+    Column('assortment_type', 'String', 'assortment.type'),
+    Column('assortment_code', 'String', 'assortment.code'),
+    Column('assortment_name', 'String', 'assortment.name'),
+    Column('assortment_gtin', 'String', 'assortment.gtin'),
+    Column('assortment_brand', 'String', 'assortment.brand'),
+    Column('assortment_state', 'String', 'assortment.state'),
+    Column('assortment_folder', 'String', 'assortment.folder'),
+    Column('assortment_volume', 'Float64', 'assortment.volume'),
+    Column('stock_stock', 'Float64', 'stock.stock'),
+    Column('stock_transit', 'Float64', 'stock.transit'),
+    Column('stock_reserve', 'Float64', 'stock.reserve'),
+    Column('stock_quantity', 'Float64', 'stock.quantity'),
+    Column('stock_days', 'Float64', 'stock.days'),
+    Column('stock_cost', 'Float64', 'stock.cost'),
+    Column('metadata_json', 'String'),
+])
+
+# Ozon Performance statistics per campaign, day and SKU
+OZON_CAMPAIGN_STATS = TableSchema('ozon_campaign_stats', [
+    Column('campaign_id', 'Int64'),
+    Column('campaign_title', 'String'),
+    Column('date', 'Date'),
+    Column('sku', 'String'),
+    Column('title', 'String'),
+    Column('price', 'Float64'),
+    Column('views', 'Int64'),
+    Column('clicks', 'Int64'),
+    Column('ctr', 'Float64'),
+    Column('to_cart', 'Int64', 'toCart'),
+    Column('avg_bid', 'Float64', 'avgBid'),
+    Column('money_spent', 'Float64', 'moneySpent'),
+    Column('orders', 'Int64'),
+    Column('orders_money', 'Float64', 'ordersMoney'),
+    Column('Project', 'String'),
+    Column('Marketplace', 'String'),
+    Column('load_dt', 'DateTime'),
+])
+
+# Ozon finance transactions, one row per operation
+OZON_FINANCE = TableSchema('ozon_finance', [
+    Column('project', 'String'),
+    Column('operation_id', 'Int64'),
+    Column('operation_type', 'String'),
+    Column('operation_date', 'DateTime', nullable=True),
+    Column('operation_type_name', 'String'),
+    Column('delivery_charge', 'Float64'),
+    Column('return_delivery_charge', 'Float64'),
+    Column('accruals_for_sale', 'Float64'),
+    Column('sale_commission', 'Float64'),
+    Column('amount', 'Float64'),
+    Column('type', 'String'),
+    Column('posting_delivery_schema', 'String', 'posting.delivery_schema'),
+    Column('posting_order_date', 'DateTime', 'posting.order_date', nullable=True),
+    Column('posting_posting_number', 'String', 'posting.posting_number'),
+    Column('posting_warehouse_id', 'Int64', 'posting.warehouse_id'),
+    Column('item_name', 'String', nullable=True),
+    Column('item_sku', 'Int64'),
+    Column('service_name', 'String', nullable=True),
+    Column('service_price', 'Float64', nullable=True),
+])
+
+# Ozon realization by day, one row per report line; landed as Parquet by ozon_realization
+OZON_REALIZATION = TableSchema('ozon_realization', [
+    Column('project', 'String'),
+    Column('date', 'Date'),
+    Column('row_number', 'Int64', 'rowNumber'),
+    Column('item_name', 'String', 'item.name'),
+    Column('item_offer_id', 'String', 'item.offer_id'),
+    Column('item_barcode', 'String', 'item.barcode'),
+    Column('item_sku', 'Int64', 'item.sku'),
+    Column('seller_price_per_instance', 'Float64'),
+    Column('commission_ratio', 'Float64'),
+    Column('delivery_commission_price_per_instance', 'Float64', 'delivery_commission.price_per_instance', nullable=True),
+    Column('delivery_commission_quantity', 'Int64', 'delivery_commission.quantity', nullable=True),
+    Column('delivery_commission_amount', 'Float64', 'delivery_commission.amount', nullable=True),
+    Column('delivery_commission_compensation', 'Float64', 'delivery_commission.compensation', nullable=True),
+    Column('delivery_commission_commission', 'Float64', 'delivery_commission.commission', nullable=True),
+    Column('delivery_commission_bonus', 'Float64', 'delivery_commission.bonus', nullable=True),
+    Column('delivery_commission_standard_fee', 'Float64', 'delivery_commission.standard_fee', nullable=True),
+    Column('delivery_commission_total', 'Float64', 'delivery_commission.total', nullable=True),
+    Column('delivery_commission_stars', 'Float64', 'delivery_commission.stars', nullable=True),
+    Column('delivery_commission_bank_coinvestment', 'Float64', 'delivery_commission.bank_coinvestment', nullable=True),
+    Column('delivery_commission_pick_up_point_coinvestment', 'Float64', 'delivery_commission.pick_up_point_coinvestment', nullable=True),
+    Column('return_commission_price_per_instance', 'Float64', 'return_commission.price_per_instance', nullable=True),
+    Column('return_commission_quantity', 'Int64', 'return_commission.quantity', nullable=True),
+    Column('return_commission_amount', 'Float64', 'return_commission.amount', nullable=True),
+    Column('return_commission_compensation', 'Float64', 'return_commission.compensation', nullable=True),
+    Column('return_commission_commission', 'Float64', 'return_commission.commission', nullable=True),
+    Column('return_commission_bonus', 'Float64', 'return_commission.bonus', nullable=True),
+    Column('return_commission_standard_fee', 'Float64', 'return_commission.standard_fee', nullable=True),
+    Column('return_commission_total', 'Float64', 'return_commission.total', nullable=True),
+    Column('return_commission_stars', 'Float64', 'return_commission.stars', nullable=True),
+    Column('return_commission_bank_coinvestment', 'Float64', 'return_commission.bank_coinvestment', nullable=True),
+    Column('return_commission_pick_up_point_coinvestment', 'Float64', 'return_commission.pick_up_point_coinvestment', nullable=True),
+])
+
+# MoySklad profit by product, one row per product and day
+MOYSKLAD_PROFIT = TableSchema('moysklad_profit_by_product', [
+    Column('project', 'String'),
+    Column('date', 'Date'),
+    Column('product_name', 'String', 'assortment.name'),
+    Column('product_code', 'String', 'assortment.code'),
+    Column('product_article', 'String', 'assortment.article'),
+    Column('product_uom', 'String', 'assortment.uom.name'),
+    Column('product_href', 'String', 'assortment.meta.href'),
+    Column('product_uuid', 'String'),
+    Column('sell_quantity', 'Float64', 'sellQuantity'),
+    Column('sell_price', 'Float64', 'sellPrice'),
+    Column('sell_cost', 'Float64', 'sellCost'),
+    Column('sell_sum', 'Float64', 'sellSum'),
+    Column('sell_cost_sum', 'Float64', 'sellCostSum'),
+    Column('return_quantity', 'Float64', 'returnQuantity'),
+    Column('return_price', 'Float64', 'returnPrice'),
+    Column('return_cost', 'Float64', 'returnCost'),
+    Column('return_sum', 'Float64', 'returnSum'),
+    Column('return_cost_sum', 'Float64', 'returnCostSum'),
+    Column('profit', 'Float64'),
+    Column('margin', 'Float64'),
+    Column('sales_margin', 'Float64', 'salesMargin'),
+    Column('load_dt', 'DateTime'),
+])
+
+# Supplier orders, one row per order line (srid); the latest lastChangeDate wins
+ORDERS_WB = TableSchema('orders_wb', [
+    Column('date', 'DateTime'),
+    Column('lastChangeDate', 'DateTime'),
+    Column('warehouseName', 'String'),
+    Column('warehouseType', 'String'),
+    Column('countryName', 'String'),
+    Column('oblastOkrugName', 'String'),
+    Column('regionName', 'String'),
+    Column('supplierArticle', 'String'),
+    Column('nmId', 'Int64'),
+    Column('barcode', 'String'),
+    Column('category', 'String'),
+    Column('subject', 'String'),
+    Column('brand', 'String'),
+    Column('techSize', 'String'),
+    Column('incomeID', 'Int64'),
+    Column('isSupply', 'UInt8'),
+    Column('isRealization', 'UInt8'),
+    Column('totalPrice', 'Float64'),
+    Column('discountPercent', 'Int64'),
+    Column('spp', 'Float64'),
+    Column('finishedPrice', 'Float64'),
+    Column('priceWithDisc', 'Float64'),
+    Column('isCancel', 'UInt8'),
+    Column('cancelDate', 'DateTime', nullable=True),
+    Column('orderType', 'String'),
+    Column('sticker', 'String'),
+    Column('gNumber', 'String'),
+    Column('srid', 'String'),
+    Column('Marketplace', 'String'),
+    Column('Project', 'String'),
+])
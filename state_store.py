@@ -0,0 +1,53 @@
+"""Small JSON state files shared by the resumable and incremental loaders.
+
+Each loader keeps its own file under STATE_DIR (./state by default,
+overridable with the STATE_DIR environment variable), e.g. the rrdid
+checkpoints of the realization backfills. Writes go to a temporary file that
+is then renamed over the old one, so a crash mid-write never leaves a
+half-written state behind.
+
+Usage:
+    checkpoints = JSONState('realization_checkpoints')
+    checkpoints.set('WB-GutenTech|2024-12-01|2025-01-04', {'rrd_id': 123, 'done': False})
+"""
+import json
+import os
+from typing import Any, Dict
+
+# Directory holding the state files
+STATE_DIR = os.getenv('STATE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state'))
+
+
+class JSONState:
+    """Key/value state persisted to one JSON file"""
+
+    def __init__(self, name: str, state_dir: str = None):
+        self.path = os.path.join(state_dir or STATE_DIR, f'{name}.json')
+        self.data: Dict[str, Any] = self._load()
+
+    def _load(self) -> Dict[str, Any]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str, default=None):
+        return self.data.get(key, default)
+
+    # Re-read before every write so loaders sharing a file never drop each other's keys
+    def set(self, key: str, value):
+        self.data = self._load()
+        self.data[key] = value
+        self.save()
+
+    def delete(self, key: str):
+        self.data = self._load()
+        if self.data.pop(key, None) is not None:
+            self.save()
@@ -0,0 +1,158 @@
+"""Delta storage of stock snapshots.
+
+script.py and stock_smart.py used to append the whole stock matrix on every
+run although most quantities do not change between runs. SnapshotStore
+hashes every row of a snapshot (one vectorized hash over the value columns,
+keyed by e.g. cabinet, warehouse and vendor code), compares it with the
+hashes of the previous snapshot kept in state/stock_snapshots.json and
+returns only the rows that are new or changed. A key that disappeared gets a
+tombstone row: its key columns, zero quantities, the columns declared
+constant (e.g. Marketplace) copied from the current snapshot and every other
+descriptive column left empty. Every checkpoint_days a full snapshot is
+written instead, which bounds how far back a reader has to look.
+
+Keys are kept in the state as JSON lists of the key values followed by the
+occurrence number of a repeated key, so any value round-trips unchanged.
+
+point_in_time rebuilds the stock at any moment from the table: the last row
+per key since the latest checkpoint before that moment, leaving out rows
+whose quantities are all zero (tombstones included).
+
+The state is only advanced by save() once the rows are inserted, so a
+failed insert is retried as a delta against the last stored snapshot.
+
+Usage:
+    store = SnapshotStore('warehouse_data_wb', ['Project', 'warehouseName', 'vendorCode'],
+                          ['quantity', 'inWayToClient'], 'Date', constant_columns=['Marketplace'])
+    rows, snapshot = store.diff(df, project_name, today)
+    insert_dataframe(client, 'warehouse_data_wb', rows, columns)
+    store.save(project_name, snapshot)
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+import pandas as pd
+from clickhouse_connect.driver.binding import format_query_value
+
+from state_store import JSONState
+
+# Days between two full snapshots
+CHECKPOINT_DAYS = 7
+
+
+class SnapshotStore:
+    """Change detection between consecutive stock snapshots of one table"""
+
+    def __init__(self, table_name: str, key_columns: List[str], value_columns: List[str], time_column: str,
+                 checkpoint_days: int = CHECKPOINT_DAYS, state: JSONState = None, constant_columns: List[str] = None):
+        self.table_name = table_name
+        self.key_columns = key_columns
+        self.value_columns = value_columns
+        self.time_column = time_column
+        self.constant_columns = constant_columns or []
+        self.checkpoint_days = checkpoint_days
+        self.state = state or JSONState('stock_snapshots')
+
+    def _state_key(self, scope: str) -> str:
+        return f"{self.table_name}|{scope}"
+
+    def row_keys(self, df: pd.DataFrame) -> List[Tuple]:
+        """One tuple per row: the key values as strings (None for nulls), then the occurrence of a repeated key"""
+        parts = [df[col].astype('string').astype(object).where(df[col].notna(), None).tolist()
+                 for col in self.key_columns]
+        occurrence = df.groupby(self.key_columns, dropna=False, sort=False).cumcount().tolist()
+        return list(zip(*parts, occurrence))
+
+    def row_hashes(self, df: pd.DataFrame) -> pd.Series:
+        """Hash the value columns of every row in one vectorized pass"""
+        return pd.util.hash_pandas_object(df[self.value_columns], index=False).map('{:016x}'.format)
+
+    def diff(self, df: pd.DataFrame, scope: str, now: datetime) -> Tuple[pd.DataFrame, Dict]:
+        """Return the rows to write for this snapshot and the state to save after the insert"""
+        stored = self.state.get(self._state_key(scope)) or {}
+        if isinstance(stored.get('hashes'), dict):
+            # State of the old delimited-string keys: start again from a full checkpoint
+            stored = {}
+        previous = dict(zip(map(tuple, stored.get('keys', [])), stored.get('hashes', [])))
+        checkpoints = stored.get('checkpoints', [])
+
+        keys = self.row_keys(df)
+        hashes = self.row_hashes(df).to_numpy()
+        snapshot = {
+            'keys': [list(key) for key in keys],
+            'hashes': hashes.tolist(),
+            'checkpoints': checkpoints,
+            'updated': now.isoformat()
+        }
+
+        # Keys gone since the previous snapshot: zero quantities from now on
+        current = set(keys)
+        gone = [key for key in previous if key not in current]
+        removed = self.tombstones(gone, df, now)
+
+        last_checkpoint = datetime.fromisoformat(checkpoints[-1]) if checkpoints else None
+        if last_checkpoint is None or now - last_checkpoint >= timedelta(days=self.checkpoint_days):
+            snapshot['checkpoints'] = checkpoints + [now.isoformat()]
+            print(f"Full {self.table_name} checkpoint for {scope}: {len(df)} rows, {len(gone)} removed")
+            return pd.concat([df, removed], ignore_index=True), snapshot
+
+        # Rows that are new or whose values changed since the previous snapshot
+        previous_hashes = np.array([previous.get(key) for key in keys], dtype=object)
+        changed = df[previous_hashes != hashes]
+        print(f"{self.table_name} delta for {scope}: {len(changed)} changed and {len(gone)} removed "
+              f"of {len(df)} rows")
+        return pd.concat([changed, removed], ignore_index=True), snapshot
+
+    def tombstones(self, keys: List[Tuple], like: pd.DataFrame, now: datetime) -> pd.DataFrame:
+        """Rows marking removed keys: key and constant columns set, everything else zero or empty"""
+        if not keys:
+            return like.iloc[0:0]
+        # The last element of a key is its occurrence number, not a column
+        df = pd.DataFrame([key[:-1] for key in keys], columns=self.key_columns)
+        for col in like.columns:
+            if col in self.key_columns:
+                df[col] = df[col].astype(like[col].dtype)
+            elif col == self.time_column:
+                df[col] = pd.Timestamp(now)
+            elif col in self.constant_columns and len(like):
+                df[col] = like[col].iloc[0]
+            elif pd.api.types.is_datetime64_any_dtype(like[col]):
+                df[col] = pd.Series(pd.NaT, index=df.index).astype(like[col].dtype)
+            elif pd.api.types.is_numeric_dtype(like[col]):
+                df[col] = pd.Series(0, index=df.index).astype(like[col].dtype)
+            else:
+                df[col] = pd.Series('', index=df.index).astype(like[col].dtype)
+        return df[like.columns]
+
+    def save(self, scope: str, snapshot: Dict):
+        self.state.set(self._state_key(scope), snapshot)
+
+    def last_checkpoint(self, scope: str, at: datetime):
+        """Latest full snapshot at or before at, or None when unknown"""
+        stored = self.state.get(self._state_key(scope)) or {}
+        earlier = [datetime.fromisoformat(ts) for ts in stored.get('checkpoints', [])
+                   if datetime.fromisoformat(ts) <= at]
+        return max(earlier) if earlier else None
+
+    def point_in_time(self, client, at: datetime, scope: str = None, where: str = '1') -> pd.DataFrame:
+        """Rebuild the stock as of at: the last row per key written up to at, zero rows dropped.
+
+        The scan starts at the latest full checkpoint of scope before at;
+        without a known checkpoint the whole history up to at is read, which
+        gives the same result because removed keys carry tombstones.
+        """
+        conditions = [f"{self.time_column} <= {format_query_value(at)}", f"({where})"]
+        since = self.last_checkpoint(scope, at) if scope is not None else None
+        if since is not None:
+            conditions.append(f"{self.time_column} >= {format_query_value(since)}")
+
+        df = client.query_df(
+            f"SELECT * FROM {self.table_name} WHERE {' AND '.join(conditions)} "
+            f"ORDER BY {self.time_column} DESC LIMIT 1 BY {', '.join(self.key_columns)}"
+        )
+        numeric = [col for col in self.value_columns if col in df.columns and pd.api.types.is_numeric_dtype(df[col])]
+        if numeric:
+            df = df[(df[numeric] != 0).any(axis=1)]
+        return df.reset_index(drop=True)
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ozon_finance import flatten_operations  # noqa: E402
+from schemas import OZON_FINANCE  # noqa: E402
+
+
+def operation(operation_id, items, services):
+    return {
+        'operation_id': operation_id,
+        'operation_type': 'OperationMarketplaceServiceStorage',
+        'operation_date': '2025-01-15 00:00:00',
+        'operation_type_name': 'Storage',
+        'amount': -12.5,
+        'type': 'services',
+        'posting': {'delivery_schema': '', 'order_date': '', 'posting_number': '', 'warehouse_id': 0},
+        'items': items,
+        'services': services,
+    }
+
+
+def test_flatten_operations_with_all_lists_empty():
+    df = flatten_operations([operation(1, [], []), operation(2, [], [])], 'Ozon-Test')
+
+    assert list(df.columns) == OZON_FINANCE.names
+    assert df['operation_id'].tolist() == [1, 2]
+    assert df['item_name'].isna().all()
+    assert df['service_name'].isna().all()
+
+
+def test_flatten_operations_takes_first_item_and_service():
+    operations = [
+        operation(1, [{'name': 'Kettle', 'sku': 111}, {'name': 'Lid', 'sku': 222}],
+                  [{'name': 'MarketplaceServiceItemDelivToCustomer', 'price': -30.0}]),
+        operation(2, [], []),
+    ]
+    df = flatten_operations(operations, 'Ozon-Test')
+
+    assert df.loc[0, 'item_name'] == 'Kettle'
+    assert df.loc[0, 'item_sku'] == 111
+    assert df.loc[0, 'service_name'] == 'MarketplaceServiceItemDelivToCustomer'
+    assert df.loc[0, 'service_price'] == -30.0
+    assert pd.isna(df.loc[1, 'item_name'])
@@ -0,0 +1,124 @@
+"""Campaign selection for the WB advertising pipelines.
+
+/adv/v2/fullstats is the slowest call of the advertising scripts (one
+request per minute per cabinet), yet /adv/v1/promotion/count returns every
+campaign the cabinet ever had, including ones that finished months ago.
+active_campaign_ids keeps only campaigns whose active window can overlap the
+requested dates, using the status, changeTime and startTime/endTime already
+fetched, so fewer 100-campaign chunks are sent.
+
+Campaign metadata (name, type, status, start/end/create times) comes from
+a local catalog kept per cabinet in state/campaign_catalog.json.
+sync_campaign_catalog posts to /adv/v1/promotion/adverts only the ids whose
+changeTime in /adv/v1/promotion/count moved since the last sync and reads
+everything else locally.
+
+Usage:
+    campaigns = await sync_campaign_catalog(client, df_advert)
+    advert_ids = active_campaign_ids(campaigns, [specific_date], adverts=df_advert)
+    stats = await client.fetch_campaign_stats(advert_ids, [specific_date])
+"""
+from datetime import timedelta
+from typing import List
+
+import pandas as pd
+
+from state_store import JSONState
+from wb_client import WBClient
+
+# Campaign statuses
+STATUS_DELETING = -1
+STATUS_READY = 4
+STATUS_FINISHED = 7
+STATUS_REFUSED = 8
+STATUS_ACTIVE = 9
+STATUS_PAUSED = 11
+
+# Statuses of campaigns that no longer show ads; they stop at endTime/changeTime
+STOPPED_STATUSES = {STATUS_DELETING, STATUS_FINISHED, STATUS_REFUSED}
+
+# Campaign fields kept in the local catalog
+CATALOG_FIELDS = ['advertId', 'name', 'type', 'status', 'startTime', 'endTime', 'createTime', 'changeTime']
+
+# Timezone of the dates in the WB statistics
+WB_TIMEZONE = 'Europe/Moscow'
+
+
+# Function to parse a WB time column into UTC timestamps (NaT when missing)
+def _parse_times(df: pd.DataFrame, column: str) -> pd.Series:
+    if column not in df.columns:
+        return pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns, UTC]')
+    return pd.to_datetime(df[column], format='mixed', errors='coerce', utc=True)
+
+
+# Function to keep the campaigns that could have statistics on the given dates
+def active_campaign_ids(campaigns: pd.DataFrame, dates: List[str], adverts: pd.DataFrame = None) -> List[int]:
+    """Return the advertIds whose active window overlaps [min(dates), max(dates)].
+
+    A campaign is skipped when it is still waiting for launch, when it
+    starts after the last requested day, or when it was stopped (finished,
+    refused or being deleted) before the first requested day. Campaigns with
+    missing times are kept, so the filter only ever drops certain misses.
+    """
+    if campaigns.empty:
+        return []
+
+    if adverts is not None and 'changeTime' not in campaigns.columns and 'changeTime' in adverts.columns:
+        campaigns = campaigns.merge(adverts[['advertId', 'changeTime']], on='advertId', how='left')
+
+    days = sorted(pd.Timestamp(str(d)[:10]) for d in dates)
+    window_begin = days[0].tz_localize(WB_TIMEZONE)
+    window_end = (days[-1] + timedelta(days=1)).tz_localize(WB_TIMEZONE)
+
+    status = campaigns['status']
+    start = _parse_times(campaigns, 'startTime')
+    end = _parse_times(campaigns, 'endTime')
+    changed = _parse_times(campaigns, 'changeTime')
+
+    # Last moment a stopped campaign could have shown ads
+    stopped_at = pd.concat([end, changed], axis=1).max(axis=1)
+
+    not_launched = status == STATUS_READY
+    starts_later = start >= window_end
+    stopped_before = status.isin(STOPPED_STATUSES) & (stopped_at < window_begin)
+
+    keep = ~(not_launched | starts_later | stopped_before)
+    advert_ids = campaigns.loc[keep, 'advertId'].tolist()
+    print(f"Campaigns active in {days[0].date()}..{days[-1].date()}: {len(advert_ids)} of {len(campaigns)}")
+    return advert_ids
+
+
+# Function to bring the local campaign catalog of a cabinet up to date and return its campaigns
+async def sync_campaign_catalog(client: WBClient, adverts: pd.DataFrame, catalog: JSONState = None) -> pd.DataFrame:
+    """Return campaign metadata for every advertId in adverts, like fetch_campaign_data.
+
+    Only campaigns that are new or whose changeTime differs from the stored
+    one are fetched from /adv/v1/promotion/adverts; the rest are local
+    reads. A campaign that fails to download is retried on the next sync.
+    """
+    catalog = catalog or JSONState('campaign_catalog')
+    stored = catalog.get(client.project_name, {})
+
+    change_times = dict(zip(adverts['advertId'].astype(str), adverts['changeTime'].astype(str)))
+    changed = [int(advert_id) for advert_id, change_time in change_times.items()
+               if stored.get(advert_id, {}).get('changeTime') != change_time]
+    print(f"Campaign catalog for {client.project_name}: {len(changed)} of {len(change_times)} campaigns changed")
+
+    if changed:
+        fresh = await client.fetch_campaign_data(changed)
+        for record in fresh.to_dict('records'):
+            advert_id = str(record['advertId'])
+            entry = {field: record.get(field) for field in CATALOG_FIELDS}
+            entry['changeTime'] = change_times.get(advert_id)
+            stored[advert_id] = entry
+        catalog.set(client.project_name, stored)
+
+    campaigns = pd.DataFrame(
+        [stored[advert_id] for advert_id in change_times if advert_id in stored],
+        columns=CATALOG_FIELDS
+    )
+    if not campaigns.empty:
+        campaigns = campaigns.sort_values(by='createTime', ascending=False)
+    campaigns['Project'] = client.project_name
+    campaigns['Marketplace'] = 'Wildberries'
+    return campaigns.reset_index(drop=True)
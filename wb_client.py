@@ -0,0 +1,487 @@
+"""Shared async client for the Wildberries seller APIs.
+
+Every ingestion script talks to advert-api, seller-analytics-api and
+statistics-api through one WBClient per seller cabinet. The client keeps a
+single aiohttp session with a pooled keep-alive connector, so consecutive
+calls to the same host reuse the open TLS connection instead of paying a new
+handshake per request. Every request first takes a token from the shared
+rate limiter, which paces calls per (endpoint, API key) from WB's quota
+headers instead of fixed sleeps.
+
+Usage:
+    async with WBClient(KeyGuten, 'WB-GutenTech') as client:
+        df_advert = await client.fetch_campaign_count()
+        df_campaign = await client.fetch_campaign_data(df_advert['advertId'].tolist())
+"""
+import asyncio
+import json
+from datetime import date, timedelta
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiohttp
+import pandas as pd
+
+from rate_limiter import RateLimiter, default_limiter
+
+# API endpoints
+url_promotion_count = 'https://advert-api.wildberries.ru/adv/v1/promotion/count'
+url_promotion_adv = 'https://advert-api.wildberries.ru/adv/v1/promotion/adverts'
+url_fullstats = 'https://advert-api.wildberries.ru/adv/v2/fullstats'
+url_nm_report = 'https://seller-analytics-api.wildberries.ru/api/v2/nm-report/detail'
+url_history = 'https://seller-analytics-api.wildberries.ru/api/v2/nm-report/detail/history'
+url_warehouse_remains = 'https://seller-analytics-api.wildberries.ru/api/v1/warehouse_remains'
+url_realization = 'https://statistics-api.wildberries.ru/api/v5/supplier/reportDetailByPeriod'
+url_orders = 'https://statistics-api.wildberries.ru/api/v1/supplier/orders'
+
+# Limits of one /adv/v2/fullstats request: campaigns per call and days per interval
+FULLSTATS_MAX_IDS = 100
+FULLSTATS_MAX_DAYS = 31
+
+# Limits of one nm-report/detail/history request: products per call and days per period
+HISTORY_MAX_IDS = 20
+HISTORY_MAX_DAYS = 7
+
+# Terminal statuses of a warehouse remains task that will never become "done"
+WAREHOUSE_TASK_FAILED = {'canceled', 'purged'}
+
+# Rows returned by one supplier/orders request at most; a shorter page is the last one
+ORDERS_MAX_ROWS = 80000
+
+
+class WBAPIError(Exception):
+    """Raised when WB answers a paginated call with an error, so callers can resume"""
+
+
+class WBResponse:
+    """Finished response with the attributes the scripts used from requests.Response"""
+
+    def __init__(self, status_code: int, headers, text: str):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class WBClient:
+    """Pooled keep-alive session for one seller cabinet"""
+
+    def __init__(self, api_key: str, project_name: str, limit_per_host: int = 8, timeout: int = 60,
+                 limiter: RateLimiter = None):
+        self.api_key = api_key
+        self.project_name = project_name
+        self.limiter = limiter or default_limiter
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit_per_host=self.limit_per_host,  # Connections kept open per WB host
+            keepalive_timeout=120,               # Keep idle connections through the 65 s fullstats gaps
+            ttl_dns_cache=600
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers={'Authorization': self.api_key, 'Accept': 'application/json'},
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def request(self, method: str, url: str, max_retries: int = 3, retry_delay: int = 30,
+                      **kwargs) -> WBResponse:
+        """Send a request, retrying on network errors, 429 and 5xx responses"""
+        response = None
+        for attempt in range(max_retries):
+            await self.limiter.acquire(url, self.api_key)
+            try:
+                async with self.session.request(method, url, **kwargs) as raw:
+                    text = await raw.text()
+                    response = WBResponse(raw.status, raw.headers, text)
+                self.limiter.update(url, self.api_key, response.status_code, response.headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Request failed for {self.project_name}: {str(e)}")
+                if attempt == max_retries - 1:
+                    raise
+                await asyncio.sleep(retry_delay)
+                continue
+
+            # Handle rate limiting (429 status code); the limiter holds the next attempt back
+            if response.status_code == 429:
+                print(f"Rate limit exceeded for {self.project_name} on {url}. Waiting for the quota to reset...")
+                continue
+
+            # Retry transient server errors
+            if response.status_code >= 500 and attempt < max_retries - 1:
+                print(f"Server error {response.status_code} for {self.project_name}. Retrying in {retry_delay} seconds...")
+                await asyncio.sleep(retry_delay)
+                continue
+
+            return response
+
+        return response
+
+    async def get(self, url: str, **kwargs) -> WBResponse:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> WBResponse:
+        return await self.request('POST', url, **kwargs)
+
+    # Function to fetch the campaign list with changeTime per campaign
+    async def fetch_campaign_count(self) -> pd.DataFrame:
+        response = await self.get(url_promotion_count)
+        if response.status_code != 200:
+            print(f"Failed to retrieve data for {self.project_name}. Status code: {response.status_code}")
+            return pd.DataFrame(columns=['advertId', 'changeTime', 'type', 'status', 'count'])
+        return process_advert_data(response.json())
+
+    # Function to fetch campaign details
+    async def fetch_campaign_data(self, advert_ids: List[int], chunk_size: int = 50) -> pd.DataFrame:
+        chunks = [advert_ids[i:i + chunk_size] for i in range(0, len(advert_ids), chunk_size)]
+        all_campaign_data = []
+        for idx, chunk in enumerate(chunks):
+            response = await self.post(
+                url_promotion_adv,
+                params={"order": "create", "direction": "desc"},
+                json=chunk
+            )
+            if response.status_code == 200:
+                all_campaign_data.extend(response.json())
+                print(f"Data retrieved successfully for {self.project_name} chunk {idx + 1}")
+            else:
+                print(f"Error for {self.project_name} chunk {idx + 1}: {response.status_code}, {response.text}")
+
+        campaign_df = pd.DataFrame(all_campaign_data)
+        if not campaign_df.empty:
+            campaign_df = campaign_df.sort_values(by='createTime', ascending=False)
+        campaign_df['Project'] = self.project_name
+        campaign_df['Marketplace'] = 'Wildberries'
+        return campaign_df
+
+    # Function to fetch campaign stats for one or more dates
+    async def fetch_campaign_stats(self, advert_ids: List[int], dates: List[str], chunk_size: int = 100) -> List[Dict]:
+        all_data = []
+        payloads = plan_fullstats_requests(advert_ids, dates, chunk_size)
+        for idx, payload in enumerate(payloads):
+            interval = payload[0]["interval"]
+            response = await self.post(url_fullstats, json=payload)
+
+            if response.status_code == 200:
+                all_data.extend(response.json() or [])
+                print(f"Data retrieved successfully for {interval['begin']}..{interval['end']}, "
+                      f"request {idx + 1}/{len(payloads)} for {self.project_name}")
+            else:
+                print(f"Error for request {idx + 1}/{len(payloads)}: {response.status_code}, {response.text}")
+                if "no companies with correct intervals" in response.text:
+                    print("No campaign of this request was active in its interval, skipping it")
+
+        return all_data if all_data else [{}]
+
+    # Function to fetch the sales funnel report with pagination
+    async def get_report(self, begin: str, end: str, page: int = 1, url: str = url_nm_report) -> List[Dict]:
+        all_data = []
+        while True:
+            request_body = {
+                "period": {"begin": begin, "end": end},
+                "orderBy": {"field": "ordersSumRub", "mode": "desc"},
+                "page": page,
+                "timezone": "Europe/Moscow",
+                "brandNames": [],
+                "objectIDs": [],
+                "nmIDs": []
+            }
+            try:
+                response = await self.post(url, json=request_body)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Request failed for {self.project_name}, page {page}: {str(e)}")
+                return all_data
+
+            if response.status_code != 200:
+                print(f"Request failed with status code {response.status_code} for {self.project_name}, page {page}")
+                print("Response text:", response.text)
+                return all_data
+
+            data = response.json()
+
+            # Validate response structure
+            if not data.get('data') or not isinstance(data['data'].get('cards'), list):
+                print(f"Invalid data structure received for {self.project_name}, page {page}")
+                return all_data
+
+            cards = data['data']['cards']
+            if not cards:
+                print(f"No more data available for {self.project_name}")
+                return all_data
+
+            all_data.extend(cards)
+            print(f"Page {page} retrieved successfully for {self.project_name} (got {len(cards)} items)")
+
+            if not data['data'].get('isNextPage', False):
+                print(f"Reached last page for {self.project_name}")
+                return all_data
+
+            page += 1
+
+    # Function to fetch product history in batches over the whole period
+    async def fetch_history(self, nm_ids: List[int], period: Dict, batch_size: int = HISTORY_MAX_IDS) -> List[Dict]:
+        """Fetch daily history for nm_ids over period; each item's history holds one entry per dt.
+
+        The period is requested in as few windows as the endpoint allows
+        (up to 7 days each), so a 6-day refresh costs one call per batch of
+        products instead of one per product batch and day.
+        """
+        batch_size = min(batch_size, HISTORY_MAX_IDS)
+        windows = period_windows(period, HISTORY_MAX_DAYS)
+        batches = [nm_ids[i:i + batch_size] for i in range(0, len(nm_ids), batch_size)]
+
+        all_data = []
+        for window in windows:
+            for idx, batch in enumerate(batches):
+                response = await self.post(url_history, json={"nmIDs": batch, "period": window})
+
+                if response.status_code == 200:
+                    try:
+                        data = response.json()
+                        if not data.get('error') and 'data' in data:
+                            all_data.extend(data['data'])
+                            print(f"Data retrieved successfully for batch {idx + 1}/{len(batches)}, "
+                                  f"{window['begin']}..{window['end']} for {self.project_name}")
+                        else:
+                            print(f"Error in response for batch {idx + 1}: {data.get('errorText', 'No error text')}")
+                    except ValueError as e:
+                        print(f"Failed to decode JSON for batch {idx + 1}: {e}")
+                else:
+                    print(f"Error for batch {idx + 1}: {response.status_code}, {response.text}")
+
+        return all_data
+
+    # Function to stream the realization report page by page with rrdid pagination
+    async def iter_realization_report(self, date_from, date_to, limit: int = 100000,
+                                      rrdid: int = 0) -> AsyncIterator[List[Dict]]:
+        """Yield one page of report rows at a time, so callers hold at most one page"""
+        limit = min(limit, 100000)
+        while True:
+            params = {
+                "dateFrom": str(date_from),
+                "dateTo": str(date_to),
+                "limit": limit,
+                "rrdid": rrdid
+            }
+            # Large pages can take minutes to render on the WB side
+            response = await self.get(url_realization, params=params, timeout=aiohttp.ClientTimeout(total=600))
+
+            # A failed page must not look like the end of the report
+            if not response.ok:
+                raise WBAPIError(f"Error for {self.project_name} at rrdid {rrdid}: "
+                                 f"{response.status_code}, {response.text}")
+
+            data = response.json() if response.status_code != 204 and response.text else []
+            if not data:
+                return
+
+            yield data
+            rrdid = data[-1].get("rrd_id", 0)
+
+            if len(data) < limit:
+                return
+
+    # Function to fetch the whole realization report into memory
+    async def get_realization_report(self, date_from, date_to, limit: int = 100000) -> List[Dict]:
+        results = []
+        async for page in self.iter_realization_report(date_from, date_to, limit):
+            results.extend(page)
+        return results
+
+    # Function to page through the orders changed since date_from, following lastChangeDate
+    async def iter_orders(self, date_from: str) -> AsyncIterator[List[Dict]]:
+        """Yield pages of orders in lastChangeDate order, starting at the date_from cursor"""
+        while True:
+            response = await self.get(url_orders, params={"dateFrom": date_from, "flag": 0})
+            if not response.ok:
+                raise WBAPIError(f"Error for {self.project_name} at dateFrom {date_from}: "
+                                 f"{response.status_code}, {response.text}")
+
+            data = response.json() if response.text else []
+            if not data:
+                return
+
+            yield data
+            last_change = data[-1].get("lastChangeDate")
+
+            # The cursor is inclusive: a short page, or one that does not move it, is the end
+            if len(data) < ORDERS_MAX_ROWS or not last_change or last_change == date_from:
+                return
+            date_from = last_change
+
+    # Function to create a warehouse remains report task
+    async def create_warehouse_report(self, params: Dict) -> Optional[str]:
+        response = await self.get(url_warehouse_remains, params=params)
+        if response.status_code != 200:
+            print(f"Failed to retrieve data ({self.project_name}). Status code: {response.status_code}")
+            print(f"Response: {response.text}")
+            return None
+        return response.json()['data']['taskId']
+
+    # Function to read the status of a warehouse remains report task
+    async def warehouse_report_status(self, task_id: str) -> Optional[str]:
+        response = await self.get(f'{url_warehouse_remains}/tasks/{task_id}/status')
+        if response.status_code != 200:
+            print(f"Failed to get task status ({self.project_name}). Status code: {response.status_code}")
+            return None
+        return response.json()['data']['status']
+
+    # Function to wait until a warehouse remains report task is done
+    async def wait_warehouse_report(self, task_id: str, first_delay: float = 5, max_delay: float = 60,
+                                    timeout: float = 900) -> None:
+        """Poll the task status with exponential backoff until it is done.
+
+        The first check comes after first_delay seconds and the wait doubles
+        up to max_delay, so a report ready after a few seconds is picked up
+        right away while slow ones cost few status calls. Raises WBAPIError
+        when the task is canceled or purged or not done within timeout.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        delay = first_delay
+        while True:
+            await asyncio.sleep(min(delay, max(deadline - loop.time(), 0)))
+            status = await self.warehouse_report_status(task_id)
+            if status == 'done':
+                return
+            if status in WAREHOUSE_TASK_FAILED:
+                raise WBAPIError(f"Warehouse report task {task_id} of {self.project_name} is {status}")
+            if loop.time() >= deadline:
+                raise WBAPIError(f"Warehouse report task {task_id} of {self.project_name} "
+                                 f"not ready after {timeout} s (last status: {status})")
+            print(f"Warehouse report of {self.project_name} is {status}, checking again in {delay} s")
+            delay = min(delay * 2, max_delay)
+
+    # Function to download a finished warehouse remains report
+    async def download_warehouse_report(self, task_id: str) -> WBResponse:
+        return await self.get(f'{url_warehouse_remains}/tasks/{task_id}/download')
+
+    # Function to create a warehouse remains report, wait for it and download it
+    async def fetch_warehouse_report(self, params: Dict) -> List[Dict]:
+        task_id = await self.create_warehouse_report(params)
+        if not task_id:
+            raise WBAPIError(f"Warehouse report task of {self.project_name} was not created")
+        await self.wait_warehouse_report(task_id)
+
+        response = await self.download_warehouse_report(task_id)
+        if response.status_code != 200:
+            raise WBAPIError(f"Failed to download task data ({self.project_name}). "
+                             f"Status code: {response.status_code}, response: {response.text}")
+        return response.json()
+
+
+# Function to split dates into consecutive runs of at most max_days days
+def date_intervals(dates: List[str], max_days: int = FULLSTATS_MAX_DAYS) -> List[Dict[str, str]]:
+    days = sorted({date.fromisoformat(str(d)[:10]) for d in dates})
+    intervals = []
+    for day in days:
+        if intervals:
+            begin, end = intervals[-1]
+            if day == end + timedelta(days=1) and (day - begin).days < max_days:
+                intervals[-1] = (begin, day)
+                continue
+        intervals.append((day, day))
+    return [{"begin": begin.isoformat(), "end": end.isoformat()} for begin, end in intervals]
+
+
+# Function to split a {"begin", "end"} period into windows of at most max_days days
+def period_windows(period: Dict[str, str], max_days: int) -> List[Dict[str, str]]:
+    begin = date.fromisoformat(str(period["begin"])[:10])
+    end = date.fromisoformat(str(period["end"])[:10])
+    days = [begin + timedelta(days=i) for i in range((end - begin).days + 1)]
+    return date_intervals(days, max_days)
+
+
+# Function to pack (campaign, interval) items into as few fullstats requests as the API allows
+def plan_fullstats_requests(advert_ids: List[int], dates: List[str],
+                            chunk_size: int = FULLSTATS_MAX_IDS) -> List[List[Dict]]:
+    """Return fullstats payloads covering every campaign on every date.
+
+    Each item asks for one campaign over a whole interval of up to 31 days,
+    so a month costs the same number of calls as a single day: one per 100
+    campaigns. Items of different intervals share a request when a chunk
+    has room left, but a campaign appears at most once per request: WB
+    expects one entry per campaign, so the other intervals of a campaign go
+    into other requests.
+    """
+    requests = []
+    for interval in date_intervals(dates):
+        for advert_id in advert_ids:
+            # First request with room that does not already ask for this campaign
+            for request in requests:
+                if len(request["items"]) < chunk_size and advert_id not in request["ids"]:
+                    break
+            else:
+                request = {"items": [], "ids": set()}
+                requests.append(request)
+            request["items"].append({"id": advert_id, "interval": interval})
+            request["ids"].add(advert_id)
+    return [request["items"] for request in requests]
+
+
+# Function to process advert data
+def process_advert_data(data) -> pd.DataFrame:
+    df = pd.json_normalize(
+        data['adverts'] or [],
+        record_path='advert_list',
+        meta=['type', 'status', 'count']
+    )
+    if df.empty:
+        return pd.DataFrame(columns=['advertId', 'changeTime', 'type', 'status', 'count'])
+    df['changeTime'] = pd.to_datetime(df['changeTime'])
+    return df.reset_index(drop=True)
+
+
+# Function to run one per-cabinet pipeline for every project
+async def run_projects(process, project_keys: Dict[str, str], concurrent: bool = True,
+                       max_concurrency: Optional[int] = None) -> Dict:
+    """Run process(project_name, api_key) for every cabinet and collect the results.
+
+    In concurrent mode every cabinet runs as its own asyncio task, at most
+    max_concurrency at a time, so the quota waits of one cabinet overlap with
+    the work of the others; each cabinet still keeps to its own buckets
+    because limits are keyed by API key. A failing cabinet is reported and
+    left out of the results.
+    """
+    names = list(project_keys)
+    if concurrent:
+        semaphore = asyncio.Semaphore(max_concurrency or len(names) or 1)
+
+        async def limited(name):
+            async with semaphore:
+                return await process(name, project_keys[name])
+
+        outcomes = await asyncio.gather(*(limited(name) for name in names), return_exceptions=True)
+    else:
+        outcomes = []
+        for name in names:
+            try:
+                outcomes.append(await process(name, project_keys[name]))
+            except Exception as e:
+                outcomes.append(e)
+
+    results = {}
+    for name, outcome in zip(names, outcomes):
+        if isinstance(outcome, BaseException):
+            print(f"Error processing {name}: {str(outcome)}")
+            continue
+        if outcome is not None:
+            results[name] = outcome
+    return results
@@ -0,0 +1,127 @@
+"""Flattening of /adv/v2/fullstats payloads.
+
+A fullstats response nests campaign -> days -> apps -> nm. The scripts used
+to walk it in four Python loops and build a 14-key dict per product row
+before calling pd.DataFrame on the list. flatten_fullstats builds no dict at
+all: itemgetter pulls the numeric fields of every nm record straight into a
+preallocated float64 record array (np.fromiter), one column per field, and
+the frame is built from those columns; counts and ids go back to int64.
+date and advertId are repeated per day block instead of per row. Records
+with a missing or null field fall back to pandas reading the dicts, so the
+result always matches what the loop version produced.
+
+aggregate_fullstats then collapses the rows per (day, nmId, advertId). It
+groups on integer day ordinals and integer ids instead of an object column
+of Python dates, sums only the additive measures and derives ctr, cpc and cr
+from the summed clicks, views, spend and orders, rather than averaging the
+per-app ratios.
+
+Usage:
+    df = aggregate_fullstats(flatten_fullstats(campaign_stats))
+"""
+from operator import itemgetter
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Product fields of an nm record, in output order
+NM_FIELDS = ["nmId", "name", "views", "clicks", "ctr", "cpc", "sum", "atbs", "orders", "cr", "shks", "sum_price"]
+
+# Numeric product fields, read into one float64 record array
+NUMERIC_FIELDS = [field for field in NM_FIELDS if field != "name"]
+NM_RECORD = np.dtype([(field, "float64") for field in NUMERIC_FIELDS])
+
+# Numeric fields that are fractions; the others are counts and ids
+FRACTION_FIELDS = {"ctr", "cpc", "sum", "cr"}
+
+# Measures that can be summed across apps and rows
+ADDITIVE_FIELDS = ["views", "clicks", "sum", "atbs", "orders", "shks", "sum_price"]
+
+# Columns of the flattened frame
+FULLSTATS_COLUMNS = ["date"] + NM_FIELDS + ["advertId"]
+
+
+# Function to flatten fullstats entries into one row per (advertId, date, app, nmId)
+def flatten_fullstats(campaign_data: List[Dict]) -> pd.DataFrame:
+    nm_rows = []
+    block_dates = []
+    block_adverts = []
+    block_sizes = []
+
+    for entry in campaign_data:
+        advertId = entry.get("advertId")
+        for day in entry.get("days") or []:
+            size = len(nm_rows)
+            for app in day.get("apps") or []:
+                nm_rows.extend(app.get("nm") or [])
+            block_dates.append(day.get("date"))
+            block_adverts.append(advertId)
+            block_sizes.append(len(nm_rows) - size)
+
+    if not nm_rows:
+        return pd.DataFrame(columns=FULLSTATS_COLUMNS)
+
+    try:
+        # itemgetter pulls the numbers of every record into one preallocated record array,
+        # a float64 column per field, without building a row dict or an intermediate list
+        numbers = np.fromiter(map(itemgetter(*NUMERIC_FIELDS), nm_rows), dtype=NM_RECORD, count=len(nm_rows))
+        names = list(map(itemgetter("name"), nm_rows))
+    except (KeyError, TypeError, ValueError):
+        # A record with a missing, null or non-numeric field: let pandas read the dicts
+        columns = dict(pd.DataFrame(nm_rows, columns=NM_FIELDS).items())
+    else:
+        columns = {}
+        for field in NM_FIELDS:
+            if field == "name":
+                columns[field] = names
+                continue
+            values = numbers[field]
+            # Counts and ids come back as int64, as pandas infers them from the JSON integers
+            if field not in FRACTION_FIELDS and (values == np.trunc(values)).all():
+                values = values.astype("int64")
+            columns[field] = values
+
+    return pd.DataFrame({
+        "date": np.repeat(np.array(block_dates), block_sizes),
+        **columns,
+        "advertId": np.repeat(np.array(block_adverts), block_sizes),
+    })
+
+
+# Function to derive the ratio metrics from summed numerators and denominators
+def add_ratio_metrics(df: pd.DataFrame) -> pd.DataFrame:
+    views = df["views"].to_numpy(dtype="float64")
+    clicks = df["clicks"].to_numpy(dtype="float64")
+    spend = df["sum"].to_numpy(dtype="float64")
+    orders = df["orders"].to_numpy(dtype="float64")
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["ctr"] = np.where(views > 0, clicks / views * 100, 0.0).round(2)  # Click-through rate, %
+        df["cpc"] = np.where(clicks > 0, spend / clicks, 0.0).round(2)       # Cost per click
+        df["cr"] = np.where(clicks > 0, orders / clicks * 100, 0.0).round(2)  # Conversion rate, %
+    return df
+
+
+# Function to aggregate flattened fullstats per (day, nmId, advertId)
+def aggregate_fullstats(df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty:
+        return pd.DataFrame(columns=FULLSTATS_COLUMNS)
+
+    # Day ordinals (days since epoch) in WB wall-clock time; rows without a valid date are dropped
+    dates = pd.to_datetime(df["date"], errors="coerce", format="mixed")
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    valid = dates.notna().to_numpy()
+
+    work = df.loc[valid, ["nmId", "advertId", "name"] + ADDITIVE_FIELDS]
+    work["day"] = dates[valid].to_numpy().astype("datetime64[D]").astype("int64")
+
+    grouped = work.groupby(["day", "nmId", "advertId"], sort=True, as_index=False).agg(
+        name=("name", "first"),
+        **{field: (field, "sum") for field in ADDITIVE_FIELDS}
+    )
+
+    grouped["date"] = grouped["day"].to_numpy().astype("datetime64[D]").astype("datetime64[ns]")
+    grouped = add_ratio_metrics(grouped)
+    return grouped[FULLSTATS_COLUMNS]
@@ -0,0 +1,105 @@
+"""Incremental loader of Wildberries supplier orders.
+
+Product_info_WB.ipynb pulled /api/v1/supplier/orders from the start of the
+year on every run and exported the result to Excel. This loader keeps one
+lastChangeDate watermark per cabinet in the orders_watermarks state file
+and asks only for the orders created or changed since then. Following the
+API's cursor, it pages forward from the lastChangeDate of the last row of
+every page (WBClient.iter_orders). Each page is inserted into orders_wb
+before the watermark moves on, so an interrupted run resumes at the last
+stored page.
+
+orders_wb is upserted by srid. A changed order (e.g. a cancellation) comes
+back as a new version of the same srid, and the cursor is inclusive, so the
+boundary rows of a page are sent again. The table is therefore expected to
+be a ReplacingMergeTree:
+
+    ENGINE = ReplacingMergeTree(lastChangeDate) ORDER BY (Project, srid)
+
+Queries read it with FINAL, or argMax(..., lastChangeDate) by srid, to see
+only the latest version of each order.
+
+The feed is meant to run every 30 minutes, e.g. from cron:
+
+    */30 * * * * cd /opt/marketplace && python wb_orders.py
+
+Usage:
+    python wb_orders.py [--date-from 2025-01-01] [--projects WB-GutenTech]
+"""
+import argparse
+import asyncio
+from datetime import date
+
+import pandas as pd
+
+from cabinets import cabinet_keys, max_concurrency
+from clickhouse_sink import ClickHouseSink, get_clickhouse_client
+from schemas import ORDERS_WB
+from state_store import JSONState
+from wb_client import WBClient, run_projects
+
+# lastChangeDate cursor of every cabinet
+watermarks = JSONState('orders_watermarks')
+
+
+# Function to turn one page of orders into orders_wb rows, one per srid
+def normalize_orders(orders, project_name: str) -> pd.DataFrame:
+    df = pd.DataFrame(orders)
+    # Orders that were never cancelled carry 0001-01-01 as cancelDate
+    if 'cancelDate' in df.columns:
+        df['cancelDate'] = df['cancelDate'].mask(df['cancelDate'].astype('string').str.startswith('0001'))
+    df['Marketplace'] = 'Wildberries'
+    df['Project'] = project_name
+    df = ORDERS_WB.cast(df)
+    # Keep the latest version when a page repeats an order
+    return df.sort_values('lastChangeDate', kind='stable').drop_duplicates('srid', keep='last')
+
+
+# Function to load the orders of one cabinet changed since its watermark
+async def process_project(project_name: str, api_key: str, start: str) -> int:
+    date_from = (watermarks.get(project_name) or {}).get('lastChangeDate') or start
+    ch_client = get_clickhouse_client()
+    sink = ClickHouseSink(ch_client, ORDERS_WB.table, ORDERS_WB.names, ORDERS_WB.types)
+    inserted = 0
+
+    try:
+        async with WBClient(api_key, project_name) as client:
+            print(f"Fetching orders of {project_name} changed since {date_from}...")
+            async for page in client.iter_orders(date_from):
+                df = normalize_orders(page, project_name)
+                inserted += await asyncio.to_thread(sink.insert, df)
+
+                # Move the cursor only once the page is stored
+                watermarks.set(project_name, {
+                    'lastChangeDate': page[-1]['lastChangeDate'],
+                    'updated': pd.Timestamp.now().isoformat()
+                })
+    finally:
+        ch_client.close()
+
+    print(f"Upserted {inserted} orders for {project_name}")
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load new and changed WB supplier orders into orders_wb")
+    parser.add_argument('--date-from', default=date(date.today().year, 1, 1).isoformat(),
+                        help="start of the feed for cabinets without a watermark (default: start of the year)")
+    parser.add_argument('--projects', nargs='*', help="cabinet names to load (default: every WB cabinet)")
+    args = parser.parse_args()
+
+    project_keys = cabinet_keys(names=args.projects)
+    results = asyncio.run(run_projects(
+        lambda project_name, api_key: process_project(project_name, api_key, args.date_from),
+        project_keys,
+        max_concurrency=max_concurrency()
+    ))
+    print(f"Total orders upserted: {sum(results.values())}")
+
+    failed = sorted(set(project_keys) - set(results))
+    if failed:
+        print(f"Cabinets that failed and keep their previous watermark: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()